@@ -0,0 +1,214 @@
+'''
+Created on Oct 18, 2026
+'''
+import errno
+import os
+import re
+import shutil
+import sys
+
+seedDirPrefix = 's_'
+classesDirName = 'batch.classes'
+driverDirName = '.citbatch'
+resultsFileName = 'batch.results'
+
+packageRE = re.compile(r'^(\s*)package\s+([\w.]+)', re.MULTILINE)
+unsafeRE = re.compile(r'\W')
+
+driverSource = '''package citbatch
+
+import java.io.{File, PrintWriter}
+import java.lang.reflect.InvocationTargetException
+import java.nio.file.{Files, StandardCopyOption}
+import java.security.Permission
+
+class ExitTrapped(val status: Int) extends SecurityException("exit " + status)
+
+// Run the main() of each of a list of objects, moving any files it creates
+// into its seed directory, and record each exit status in a results file.
+// usage: BatchDriver results dir1 class1 dir2 class2 ...
+object BatchDriver {
+  @volatile var exiting = false
+
+  // Both our ExitTrapped and the one in a CitServer we may be running in say "exit <status>".
+  def exitStatus(t: Throwable): Int = t match {
+    case e: InvocationTargetException => exitStatus(e.getCause)
+    case x: SecurityException if x.getMessage != null && x.getMessage.startsWith("exit ") => x.getMessage.drop(5).toInt
+    case t => t.printStackTrace(); 1
+  }
+
+  def main(args: Array[String]): Unit = {
+    if (System.getSecurityManager == null) {
+      System.setSecurityManager(new SecurityManager {
+        override def checkExit(status: Int): Unit = if (!exiting) throw new ExitTrapped(status)
+        override def checkPermission(perm: Permission): Unit = {}
+      })
+    }
+    val results = new PrintWriter(args(0))
+    for ((pair, i) <- args.drop(1).grouped(2).zipWithIndex) {
+      val before = new File(".").list.toSet
+      val status = try {
+        Class.forName(pair(1)).getMethod("main", classOf[Array[String]]).invoke(null, Array[String]())
+        0
+      } catch {
+        case t: Throwable => exitStatus(t)
+      }
+      for (name <- new File(".").list if !before(name))
+        Files.move(new File(name).toPath, new File(pair(0), name).toPath, StandardCopyOption.REPLACE_EXISTING)
+      results.println(i + " " + status)
+      results.flush()
+    }
+    results.close()
+    exiting = true
+  }
+}
+'''
+
+driverCompileCommand = "scalac -d $(driver) $(driver)/BatchDriver.scala"
+
+class batchRun():
+    ''' Run a batch of seeds together.
+    Each phase runs some per-seed commands (generation) in a directory
+    per seed, then the scala source each seed generated is moved into its
+    own package, all the sources are compiled with one command, and run
+    by one driver which reports the status of each seed.
+    If a batch fails as a whole, it's split in halves until we find the
+    seeds responsible.
+    '''
+
+    def __init__(self, test, phases, compileCommand, runCommand):
+        ''' phases is a list of (per-seed commands, scala object name) pairs,
+        compileCommand compiles $(sources) into $(classes),
+        and runCommand runs the driver ($(driver)) with the arguments $(objects).
+        '''
+        self.test = test
+        self.phases = phases
+        self.compileCommand = compileCommand
+        self.runCommand = runCommand
+        self.directory = None
+
+    def seedDir(self, seed):
+        return os.path.join(self.directory, seedDirPrefix + unsafeRE.sub('_', seed))
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def prepare(self, seeds, variables):
+        ''' Remove anything left over from the previous batch and make directories for this one. '''
+        modName = 'batchRun.prepare'
+        self.directory = variables['testDir']
+        for name in os.listdir(self.directory):
+            if name.startswith(seedDirPrefix):
+                shutil.rmtree(self.path(name))
+        if os.path.exists(self.path(classesDirName)):
+            shutil.rmtree(self.path(classesDirName))
+        for name in [classesDirName, driverDirName] + [self.seedDir(seed) for seed in seeds]:
+            try:
+                os.mkdir(self.path(name))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    print >>sys.stderr, "%s: os.mkdir(%s) returns %d: %s" % (modName, e.filename, e.errno, e.strerror)
+                    return False
+
+        # Compile the driver the first time we need it.
+        if not os.path.exists(os.path.join(self.path(driverDirName), 'citbatch')):
+            with open(os.path.join(self.path(driverDirName), 'BatchDriver.scala'), 'w') as f:
+                f.write(driverSource)
+            self.test.cwd = self.directory
+            if self.test.run([driverCompileCommand], self.batchVariables(variables)) != 0:
+                return False
+        return True
+
+    def batchVariables(self, variables, **kwargs):
+        batchVariables = dict(variables)
+        batchVariables['classes'] = self.path(classesDirName)
+        batchVariables['driver'] = self.path(driverDirName)
+        batchVariables['results'] = self.path(resultsFileName)
+        batchVariables.update(kwargs)
+        return batchVariables
+
+    def namespace(self, seed, objectName):
+        ''' Move the generated source for objectName into a package of its own.
+        Return the fully qualified name of the object.
+        '''
+        source = os.path.join(self.seedDir(seed), objectName + '.scala')
+        with open(source, 'r') as f:
+            text = f.read()
+        package = seedDirPrefix + unsafeRE.sub('_', seed)
+        m = packageRE.search(text)
+        if m:
+            package = m.group(2) + '.' + package
+            text = text[:m.start(2)] + package + text[m.end(2):]
+        else:
+            text = 'package %s\n' % (package) + text
+        with open(source, 'w') as f:
+            f.write(text)
+        return package + '.' + objectName
+
+    def compileAndRun(self, seeds, objectName, objects, variables):
+        ''' Compile and run the seeds' objects. Return a map of failing seeds to their status. '''
+        failed = {}
+        if len(seeds) == 0:
+            return failed
+        self.test.cwd = self.directory
+        sources = ' '.join([os.path.join(self.seedDir(seed), objectName + '.scala') for seed in seeds])
+        retcode = self.test.run([self.compileCommand], self.batchVariables(variables, sources=sources))
+        if retcode == 0:
+            if os.path.exists(self.path(resultsFileName)):
+                os.remove(self.path(resultsFileName))
+            arguments = ' '.join(['%s %s' % (self.seedDir(seed), objects[seed]) for seed in seeds])
+            retcode = self.test.run([self.runCommand], self.batchVariables(variables, objects=arguments))
+            # The driver reports the seeds in order, so any it didn't get to are the ones
+            # to look at if it died.
+            reported = 0
+            if os.path.exists(self.path(resultsFileName)):
+                with open(self.path(resultsFileName), 'r') as f:
+                    for line in f:
+                        (index, status) = line.split()
+                        if int(status) != 0:
+                            failed[seeds[int(index)]] = int(status)
+                        reported += 1
+            seeds = seeds[reported:]
+            if len(seeds) == 0:
+                return failed
+
+        # Something failed for the batch as a whole. Split it up to find the culprits.
+        if len(seeds) == 1:
+            failed[seeds[0]] = retcode if retcode != 0 else 1
+            return failed
+        half = len(seeds) / 2
+        failed.update(self.compileAndRun(seeds[:half], objectName, objects, variables))
+        failed.update(self.compileAndRun(seeds[half:], objectName, objects, variables))
+        return failed
+
+    def run(self, seeds, variables):
+        ''' Run a batch of seeds. Return a map of each seed to its result. '''
+        results = dict([(seed, 0) for seed in seeds])
+        if not self.prepare(seeds, variables):
+            for seed in seeds:
+                results[seed] = 1
+            return results
+
+        live = list(seeds)
+        for (commands, objectName) in self.phases:
+            # Run the per-seed commands.
+            for seed in live:
+                seedVariables = dict(variables)
+                seedVariables['seed'] = seed
+                self.test.cwd = self.seedDir(seed)
+                results[seed] = self.test.run(commands, seedVariables)
+            live = [seed for seed in live if results[seed] == 0]
+
+            objects = {}
+            for seed in live:
+                try:
+                    objects[seed] = self.namespace(seed, objectName)
+                except IOError as e:
+                    print >>sys.stderr, "batchRun.run: %s: %s" % (e.filename, e.strerror)
+                    results[seed] = 1
+            live = [seed for seed in live if results[seed] == 0]
+            failed = self.compileAndRun(live, objectName, objects, variables)
+            results.update(failed)
+            live = [seed for seed in live if results[seed] == 0]
+        self.test.cwd = self.directory
+        return results
@@ -0,0 +1,216 @@
+'''
+Created on Oct 18, 2026
+
+Measure what the harness itself costs: run the test commands (and doWork) with stub tools
+which do (next to) nothing, and a MonitorRepos whose repos never change.
+'''
+from argparse import ArgumentParser
+from datetime import timedelta
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import citSupport
+from testRun import testRun
+
+# What the stub tools do.
+stubModes = {
+    'true' : 'exit 0',
+    'echo' : 'i=0; while [ $i -lt 1000 ]; do echo "line $i of the output of $0 $*"; i=$((i+1)); done',
+    'sleep' : 'sleep 0.05',
+}
+stubNames = ['firrtl-torture', 'scalac', 'scala', 'vcd2FTTester', 'chisel-torture', 'sbt']
+
+def makeStubs(directory, mode):
+    ''' Create the stub tools in directory/bin. Return its path. '''
+    bin = os.path.join(directory, 'bin')
+    os.mkdir(bin)
+    for name in stubNames:
+        path = os.path.join(bin, name)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\n%s\n' % (stubModes[mode]))
+        os.chmod(path, 0755)
+    return bin
+
+class fakeMonitorRepos():
+    ''' Stands in for MonitorRepos: there are no repos, and they never change. '''
+
+    def __init__(self, repoPaths, period, **kwargs):
+        self.repoMap = {}
+        self.checks = 0
+
+    def listen(self, port, secret, verbose = 0):
+        pass
+
+    def start(self, onChange):
+        pass
+
+    def stop(self):
+        pass
+
+    def reposChangedSince(self):
+        self.checks += 1
+        return False
+
+def rss():
+    ''' Return our current resident set size (in kilobytes). '''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024
+    except IOError:
+        # Not Linux; the best we can do is the peak.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class memorySampler():
+    ''' Sample our resident set size every interval seconds. '''
+
+    def __init__(self, interval = 0.5):
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='memorySampler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sample(self):
+        while True:
+            self.samples.append(rss())
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.samples.append(rss())
+
+class quiet():
+    ''' Send everything (ours and our children's) written to stdout and stderr to /dev/null. '''
+
+    def __enter__(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.saved = [os.dup(1), os.dup(2)]
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        os.close(devnull)
+
+    def __exit__(self, *args):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved in zip([1, 2], self.saved):
+            os.dup2(saved, fd)
+            os.close(saved)
+
+def benchRun(directory, seeds):
+    ''' Time testRun.run over the test commands, and the bare cost of running as many stub commands.
+    Return (seconds per seed, seconds per seed of harness overhead).
+    '''
+    workDir = os.path.join(directory, 'run')
+    os.mkdir(workDir)
+    test = testRun(cwd=workDir)
+    variables = { 'classpath' : '', 'testDir' : workDir }
+    commands = len(citSupport.testCommands)
+    with quiet():
+        start = time.time()
+        for n in range(seeds):
+            variables['seed'] = 'S%d' % (n)
+            test.run(citSupport.testCommands, variables)
+        perSeed = (time.time() - start) / seeds
+        # The same number of stub commands, run as cheaply as we can.
+        start = time.time()
+        for n in range(seeds):
+            for _ in range(commands):
+                subprocess.call(['firrtl-torture'], cwd=workDir)
+        bare = (time.time() - start) / seeds
+    shutil.rmtree(workDir)
+    return (perSeed, perSeed - bare)
+
+def benchWork(directory, seeds, jobs):
+    ''' Run doWork on seeds seeds with jobs workers. Return (seeds per second, memory samples). '''
+    seedFile = os.path.join(directory, 'seeds')
+    with open(seedFile, 'w') as f:
+        for n in range(seeds):
+            f.write('S%d\n' % (n))
+    citSupport.homeDir = directory
+    citSupport.seed = seedFile
+    citSupport.jobs = jobs
+    citSupport.continueOnError = True
+    citSupport.MonitorRepos = fakeMonitorRepos
+    sampler = memorySampler()
+    with quiet():
+        start = time.time()
+        citSupport.doWork(['fake'], timedelta(minutes=15), 0)
+        elapsed = time.time() - start
+    sampler.stop()
+    return (seeds / elapsed, sampler.samples)
+
+def compare(old, new):
+    ''' Print how the results in new differ from those in old. '''
+    print '%-28s %12s %12s %8s' % ('', old.get('label', 'old'), new.get('label', 'new'), 'change')
+    for key in sorted(new['metrics'].keys()):
+        if key not in old['metrics']:
+            continue
+        (o, n) = (old['metrics'][key], new['metrics'][key])
+        change = (n - o) * 100.0 / o if o != 0 else 0.0
+        print '%-28s %12.4f %12.4f %+7.1f%%' % (key, o, n, change)
+
+def main(argv=None):
+    ''' Run the benchmarks. '''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = ArgumentParser(description='Measure the overhead of the citSupport harness with stub tools.')
+    parser.add_argument('-m', '--mode', dest='mode', help='what the stub tools do [default: %(default)s]', choices=sorted(stubModes.keys()), default='true')
+    parser.add_argument('-n', '--seeds', dest='seeds', help='number of seeds for each measurement [default: %(default)s]', type=int, default=100)
+    parser.add_argument('-j', '--jobs', dest='jobs', help='comma separated numbers of workers to run doWork with [default: %(default)s]', type=str, default='1,2,4,8')
+    parser.add_argument('-l', '--long', dest='longSeeds', help='number of seeds for the (memory) long run [default: %(default)s]', type=int, default=2000)
+    parser.add_argument('--label', dest='label', help='name for these results [default: the host and time]', type=str, default=None)
+    parser.add_argument('--save', dest='save', help='file in which to save the results (as JSON)', type=str, default=None)
+    parser.add_argument('--compare', dest='compare', help='file of earlier results to compare these with', type=str, default=None)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='citbench')
+    os.environ['PATH'] = makeStubs(directory, args.mode) + os.pathsep + os.environ['PATH']
+    metrics = {}
+    try:
+        (perSeed, overhead) = benchRun(directory, args.seeds)
+        metrics['run.seconds/seed'] = perSeed
+        metrics['run.overhead seconds/seed'] = overhead
+        print 'testRun.run: %.4f seconds/seed, %.4f of them harness overhead' % (perSeed, overhead)
+        for jobs in [int(j) for j in args.jobs.split(',')]:
+            (rate, samples) = benchWork(directory, args.seeds, jobs)
+            metrics['doWork.j%d seeds/second' % (jobs)] = rate
+            print 'doWork -j %d: %.1f seeds/second' % (jobs, rate)
+        (rate, samples) = benchWork(directory, args.longSeeds, 1)
+        metrics['long.seeds/second'] = rate
+        metrics['long.rss start KB'] = samples[0]
+        metrics['long.rss end KB'] = samples[-1]
+        metrics['long.rss peak KB'] = max(samples)
+        print 'doWork %d seeds: %.1f seeds/second, rss %d KB at the start, %d KB at the end (peak %d KB)' % \
+            (args.longSeeds, rate, samples[0], samples[-1], max(samples))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        'label' : args.label if args.label is not None else '%s %s' % (socket.gethostname(), time.strftime('%Y-%m-%d %H:%M')),
+        'mode' : args.mode,
+        'seeds' : args.seeds,
+        'metrics' : metrics,
+    }
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,12 +24,30 @@ from datetime import timedelta
 import errno
 import os
 import random
+import re
 import signal
-import string
+import socket
 import sys
+import threading
+import time
 
+from batchRun import batchRun
+from commitBisect import commitBisect
+from designIndex import designIndex, designHash
+from failureArchive import failureArchive
+from failureBuckets import failureBuckets, fingerprint
+from jvmServer import jvmServer
+from metricsServer import metricsServer, metric, sample
 from monitorRepos import MonitorRepos
-from testRun import testRun
+from runDatabase import runDatabase, regressions
+from runStats import runStats
+from seedCoordinator import seedCoordinator, coordinatorClient, defaultLeaseSeconds
+from seedLog import seedLog, logPath
+from seedScheduler import seedScheduler, replayOrder
+from seedSource import openSeeds, parseShard
+from stepCache import stepCache
+from testRun import testRun, killGrace
+from workspacePool import workspacePool
 
 __all__ = []
 __version__ = 0.1
@@ -58,53 +76,36 @@ classPath = defaultClassPath
 testDir = "test"
 doExit = False
 seed = None
+# Where our seeds come from (see seedSource.openSeeds()).
+source = None
+shard = (0, 1)
+checkpointEvery = 0
+# With --workspaces, workers take their test directories from a workspacePool there.
+workspaceRoot = None
+workspaces = None
 badSeedFile = None
 continueOnError = False
+jobs = 1
+useJvmServer = False
+batchSize = 1
+cacheDir = None
+cacheMegabytes = 1024
+preempt = False
+webhookPort = None
+backend = 'github'
+statsFile = None
+stats = None
+# Shared by the pool of workers.
+workLock = threading.Lock()
+stopWork = threading.Event()
+# The workers of the current doWork (so we can stop what they're running when we're signalled).
+workers = []
 
 homeDir = os.getcwd()
 
-def seed_generator(size=8, chars=string.ascii_uppercase + string.digits):
+def seed_generator():
     '''Return the "next" seed. None when done.'''
-    def newSeedFromFile(f):
-        global seed
-        newSeed = f.readline()
-        if newSeed == '':
-            newSeed = None
-            f.close()
-            seed = 'No more seeds!'
-        else:
-            # Trim trailing white space (including newlines)
-            newSeed = newSeed.rstrip()
-        return newSeed
-
-    # Do we have a global seed?
-    global seed
-    newSeed = None
-    if seed is None:
-        newSeed = ''.join(random.choice(chars) for _ in range(size))
-    elif type(seed) is str:
-        # Does seed look like a file path?
-        if seed.find('/') >= 0:
-            # It's a file spec. Try to open it for reading.
-            # Is it an absolute or a relative path?
-            path = ''
-            if seed.startswith('/'):
-                path = seed
-            else:
-                path = os.path.join(homeDir, seed)
-            f = open(path, 'r')
-            if f is None:
-                print 'Couldn\'t open %s for reading.' % (seed)
-            else:
-                seed = f
-                newSeed = newSeedFromFile(seed)
-        elif seed != 'No more seeds!':
-            newSeed = seed
-            seed = 'No more seeds!'
-    elif type(seed) is file:
-        newSeed = newSeedFromFile(seed)
-            
-    return newSeed
+    return source.next()
 
 def init_classpath():
     return classPath
@@ -152,20 +153,171 @@ sbtTestCommands = [
     "sbt -Dsbt.log.noformat=true -DchiselfrontendVersion=3.0 -Dchisel3Version=3.0 -DfirrtlVersion=0.1-SNAPSHOT run",
 ]
 
+# With --designs, a seed whose (canonicalized) design we've already tested with these tools is skipped.
+designs = None
+designPath = None
+designMaxEntries = 100000
+
+def duplicateDesign(cwd, variables):
+    ''' Should we skip the rest of a seed's commands, since we've already tested its design? '''
+    if designs is None:
+        return False
+    path = os.path.join(cwd, 'Torture.firrtl')
+    if not os.path.exists(path):
+        return False
+    design = designHash(path)
+    if designs.seen(design):
+        return True
+    # Remember it once we've tested it.
+    variables['design'] = design
+    return False
+
+# Commands whose outputs depend only on their inputs (and the tools) declare them,
+# so their outputs may be restored from the step cache.
 testCommands = [
-    "firrtl-torture --seed $(seed)",
-    "scalac -classpath $(classpath):. Torture.scala",
+    { 'command' : "firrtl-torture --seed $(seed)",
+      'skip' : duplicateDesign },
+    { 'command' : "scalac -classpath $(classpath):. Torture.scala",
+      'cache' : { 'inputs' : ['Torture.scala'], 'outputs' : ['torture'] } },
     "scala -classpath $(classpath):. torture.Torture",
-    "vcd2FTTester --firrtl Torture.firrtl Torture.vcd TortureTester.scala",
-    "scalac -classpath $(classpath):. TortureTester.scala",
+    { 'command' : "vcd2FTTester --firrtl Torture.firrtl Torture.vcd TortureTester.scala",
+      'cache' : { 'inputs' : ['Torture.firrtl', 'Torture.vcd'], 'outputs' : ['TortureTester.scala'] } },
+    { 'command' : "scalac -classpath $(classpath):. TortureTester.scala",
+      'cache' : { 'inputs' : ['Torture.scala', 'TortureTester.scala'], 'outputs' : ['torture'] } },
     "scala -classpath $(classpath):. torture.TortureTester",
 ]
 
+# What a seed leaves in its test directory, which is removed (with --workspaces) before the next seed.
+seedOutputs = [
+    'Torture*',
+    'torture',
+    '*.vcd',
+    'target',
+    'project',
+    's_*',
+    'batch.classes',
+    'batch.results',
+]
+canaryFileName = 'DELETETHISDIRECTORYWHENDONE'
+
+# With --batch, each seed's design is generated on its own,
+# then a batch of them are compiled and run together.
+batchTestPhases = [
+    (["firrtl-torture --seed $(seed)"], 'Torture'),
+    (["vcd2FTTester --firrtl Torture.firrtl Torture.vcd TortureTester.scala"], 'TortureTester'),
+]
+batchCompileCommand = "scalac -classpath $(classpath):$(classes) -d $(classes) $(sources)"
+batchRunCommand = "scala -classpath $(classpath):$(classes):$(driver) citbatch.BatchDriver $(results) $(objects)"
+
+# With --stages, seeds are pipelined: the test commands are divided into stages
+# (by the index of the first command in each), with a limit on the number of seeds
+# in each stage at once, so one seed's generation overlaps another's simulation.
+testStages = [
+    ('generate', 0),
+    ('simulate', 2),
+    ('check', 3),
+]
+stageLimits = None
+pipelineStages = None
+commandTimeout = None
+seedTimeout = None
+continueOnTimeout = False
+timeoutSeedFile = None
+# With --logdir, each seed's output is written (compressed) to a log of its own,
+# and only the end of it is printed if the seed fails.
+logDir = None
+logSample = 0.0
+logTailLines = 50
+# With --database, the results of each seed are recorded in a runDatabase.
+databasePath = None
+database = None
+# Failing seeds are grouped by the signatures of their failures. With --exemplars,
+# only the first few seeds in each bucket are reported in full and keep their test directories.
+exemplars = None
+buckets = None
+unsafeRE = re.compile(r'[^\w.-]')
+# With --replay, the seeds which failed before (according to the database)
+# are run again before any new ones.
+replayLimit = 0
+scheduler = None
+# With --coordinator, we hand out seeds to worker processes (run with --worker) instead of running them.
+coordinatorAddress = None
+workerAddress = None
+leaseSeconds = defaultLeaseSeconds
+coordinator = None
+client = None
+# With --bisect, instead of running seeds, we find the commits which introduced the failures that
+# appeared when the repos last changed (according to the database): the candidate commits of each
+# repo are checked out in git worktrees and built with bisectBuildCommands, and the jars
+# they produce (bisectJars, relative to the worktree) are put ahead of the classpath.
+bisectMode = False
+bisectBuildCommands = [
+    "sbt -Dsbt.log.noformat=true package",
+]
+bisectJars = 'target/scala-2.11/*.jar'
+# With --archive, the artifacts of each failing seed (the files in its test directory matching archiveFiles,
+# and its log) are kept in a failureArchive there, instead of the test directory they were left in.
+archiveDir = None
+archiveMegabytes = 4096
+archiveFiles = [
+    'Torture*',
+    '*.vcd',
+    'torture',
+    'build.sbt',
+]
+archive = None
+# With --metrics, we serve our metrics (in the Prometheus text format) on [host:]port/metrics.
+metricsAddress = None
+metricsPrefix = 'citsupport'
+
+def parseStageLimits(spec):
+    ''' Parse "stage=limit,..." into a map of stage names to limits. '''
+    limits = {}
+    names = [name for (name, first) in testStages]
+    for item in spec.split(','):
+        (name, sep, limit) = item.partition('=')
+        if name not in names or not limit.isdigit() or int(limit) < 1:
+            raise CLIError('bad stage limit "%s" (stages are %s)' % (item, ', '.join(names)))
+        limits[name] = int(limit)
+    return limits
+
+def parseAddress(spec):
+    ''' Parse "[host:]port" into (host, port). '''
+    (host, sep, port) = spec.rpartition(':')
+    if not port.isdigit():
+        raise CLIError('bad address "%s" (expected [host:]port)' % (spec))
+    return (host, int(port))
+
+def abortWorkers():
+    ''' Stop handing out seeds, and kill what our workers are running (and everything it started). '''
+    stopWork.set()
+    if coordinator is not None:
+        coordinator.stop()
+    for w in workers:
+        w.test.abort()
+
+def waitForWorkers(seconds):
+    ''' Wait (at most seconds) for our workers to finish. '''
+    deadline = time.time() + seconds
+    for w in workers:
+        if w.thread is not None:
+            w.thread.join(max(0.0, deadline - time.time()))
+
 def sigterm(signum, frame):
     global doExit
     print 'citSupport: signal %d' % (signum)
     if signum == signal.SIGTERM:
         doExit = True
+        # Each command runs in a session of its own, so the signal won't have reached it.
+        # We may have interrupted a worker holding its testRun's lock, so abort them from another thread.
+        aborter = threading.Thread(target=abortWorkers, name='sigterm')
+        aborter.daemon = True
+        aborter.start()
+
+def sigusr1(signum, frame):
+    ''' Print a summary of where our time is going. '''
+    if stats is not None:
+        print >>sys.stderr, stats.summary()
 
 def initVariables():
     variables = {}
@@ -193,19 +345,30 @@ def updateVariables():
 
 def locate(test, variables):
     ''' Create the test directory and do any setup required for testing. '''
+    directory = variables['testDir']
     try:
-        os.mkdir(testDir)
+        os.mkdir(directory)
     except OSError as e:
         if e.errno != errno.EEXIST:
             print >>sys.stderr, "os.mkdir(%s) returns %d: %s" % (e.filename, e.errno, e.strerror)
             sys.exit(1)
 
-    os.chdir(testDir)
+    test.cwd = directory
     test.run(setupCommands, variables)
 
 def runATest(test, variables):
     ''' Run a test sequence of commands. '''
-    result = test.run(testCommands, variables)
+    if logDir is None:
+        return test.run(testCommands, variables, pipelineStages)
+    log = seedLog(logDir, variables['seed'], logTailLines)
+    test.log = log
+    result = 1
+    try:
+        result = test.run(testCommands, variables, pipelineStages)
+    finally:
+        test.log = None
+        # Keep the logs of failing seeds, and a sample of the others.
+        log.close((result != 0 and not test.aborted) or random.random() < logSample)
     return result
 
 def cleanup(test, variables):
@@ -218,10 +381,246 @@ def cleanup(test, variables):
         "ls $(testDir)/DELETETHISDIRECTORYWHENDONE",
         "rm -rf $(testDir)"
         ]
+    test.cwd = None
     test.run(cleanCommands, variables)
 
+class worker():
+    ''' The state of one member of the pool of test workers.
+    Each worker has its own test directory and testRun instance,
+    so workers may run seeds concurrently.
+    '''
+
+    def __init__(self, number, variables, verbose):
+        self.number = number
+        self.variables = dict(variables)
+        # With a single worker, use the test directory as is.
+        if jobs > 1:
+            self.variables['testDir'] = '%s.%d' % (testDir, number)
+        self.variables['testDir'] = os.path.join(homeDir, self.variables['testDir'])
+        self.test = testRun(verbose, stats=stats, commandTimeout=commandTimeout, seedTimeout=seedTimeout)
+        self.batch = None
+        if batchSize > 1:
+            self.batch = batchRun(self.test, batchTestPhases, batchCompileCommand, batchRunCommand)
+        self.keepTestDirectory = False
+        self.thread = None
+        # The seeds we're running (for metrics).
+        self.seeds = []
+
+def cacheSalt(repos):
+    ''' Return a string identifying the tools we're testing, for the step cache. '''
+    salt = []
+    if repos is not None:
+        for path in sorted(repos.repoMap.keys()):
+            repo = repos.repoMap[path]
+            if repo.repo is not None:
+                salt.append('%s %s' % (path, repo.localhead.hexsha))
+    for jar in classPath.split(':'):
+        if os.path.isfile(jar):
+            s = os.stat(jar)
+            salt.append('%s %d %d' % (jar, s.st_mtime, s.st_size))
+    return '\n'.join(salt)
+
+def runABatch(w, seedVariables):
+    ''' Run a batch of seeds. Return a list of their results. '''
+    if w.batch is None:
+        return [runATest(w.test, variables) for variables in seedVariables]
+    results = w.batch.run([variables['seed'] for variables in seedVariables], w.variables)
+    return [results[variables['seed']] for variables in seedVariables]
+
+def setAside(w, seed):
+    ''' Move the worker's test directory (with what a failing seed left in it) aside, and start a new one. '''
+    modName = __name__ + '.setAside'
+    directory = w.variables['testDir']
+    if workspaces is not None:
+        kept = workspaces.keep(directory, '%s.%s' % (testDir, unsafeRE.sub('_', seed)))
+        directory = workspaces.acquire()
+        w.variables['testDir'] = directory
+        w.test.cwd = directory
+    else:
+        kept = '%s.%s' % (directory, unsafeRE.sub('_', seed))
+        if os.path.exists(kept):
+            w.keepTestDirectory = True
+            return
+        os.rename(directory, kept)
+        locate(w.test, w.variables)
+    print >>sys.stderr, '%s: seed "%s" left in %s' % (modName, seed, kept)
+    # A server runs in the directory it was started in.
+    if w.test.server is not None:
+        w.test.server.stop()
+        w.test.server = jvmServer(classPath, directory, w.test.verbose)
+
+def archiveSeed(w, variables, result, signature, timedOut):
+    ''' Save the artifacts of a failing seed (from the worker's test directory) in the archive. '''
+    modName = __name__ + '.archiveSeed'
+    seed = variables['seed']
+    # In a batch, each seed's files are in a directory of its own.
+    directory = w.variables['testDir'] if w.batch is None else w.batch.seedDir(seed)
+    extras = {}
+    if logDir is not None and os.path.exists(logPath(logDir, seed)):
+        extras[os.path.basename(logPath(logDir, seed))] = logPath(logDir, seed)
+    info = { 'seed' : seed, 'result' : result, 'signature' : signature, 'timedout' : timedOut, 'testDir' : directory }
+    path = archive.add(seed, directory, archiveFiles, extras, info)
+    print >>sys.stderr, '%s: seed "%s" archived in %s' % (modName, seed, path)
+
+def noteFailure(seed, timedOut):
+    ''' Record a failing seed in the appropriate seed file, and stop unless we're to keep going. (We hold workLock.) '''
+    seedFile = badSeedFile
+    keepGoing = continueOnError
+    if timedOut:
+        print >>sys.stderr, '%s: seed "%s" timed out' % (__name__ + '.noteFailure', seed)
+        if timeoutSeedFile is not None:
+            seedFile = timeoutSeedFile
+        keepGoing = continueOnError or continueOnTimeout
+    if seedFile is not None:
+        seedFile.write(seed + '\n')
+        seedFile.flush()
+    if not keepGoing:
+        stopWork.set()
+        if coordinator is not None:
+            coordinator.stop()
+
+def runWorker(w, repos):
+    ''' Run seeds on a worker until we run out of seeds or are told to stop. '''
+    modName = __name__ + '.runWorker'
+    while not stopWork.is_set() and not doExit:
+        # Seeds are handed out in order, batchSize at a time.
+        seedVariables = []
+        with workLock:
+            while len(seedVariables) < batchSize:
+                newVariables = updateVariables()
+                if newVariables is None:
+                    stopWork.set()
+                    break
+                variables = dict(w.variables)
+                for k, v in newVariables.iteritems():
+                    variables[k] = v
+                seedVariables.append(variables)
+        if len(seedVariables) == 0:
+            break
+        if workspaces is not None:
+            workspaces.reset(w.variables['testDir'])
+        w.seeds = [variables['seed'] for variables in seedVariables]
+        results = runABatch(w, seedVariables)
+        w.seeds = []
+        # If we were preempted by a change to the repos, these results don't count.
+        if w.test.aborted:
+            break
+        # We can only say a seed timed out if it was run on its own.
+        timedOut = w.batch is None and w.test.timedOut
+        skipped = w.batch is None and w.test.skipped
+        stats.seedDone(len(seedVariables), 1 if timedOut else 0, 1 if skipped else 0, len([r for r in results if r != 0]))
+        if designs is not None:
+            for variables, result in zip(seedVariables, results):
+                if result == 0 and 'design' in variables:
+                    designs.add(variables['design'])
+        # We only have the records of the commands for a seed run on its own.
+        records = w.test.records if w.batch is None else []
+        stderrTail = w.test.stderrTail if w.batch is None else []
+        signatures = [fingerprint(records, result, stderrTail, variables) if result != 0 else None
+                      for variables, result in zip(seedVariables, results)]
+        if database is not None:
+            for variables, result, signature in zip(seedVariables, results, signatures):
+                database.seedDone(variables['seed'], result, timedOut, records, signature, skipped)
+        if client is not None:
+            for variables, result, signature in zip(seedVariables, results, signatures):
+                client.result(variables['seed'], result, timedout=timedOut, skipped=skipped, signature=signature, records=records)
+        keep = None
+        archived = []
+        with workLock:
+            for variables, result, signature in zip(seedVariables, results, signatures):
+                if scheduler is not None:
+                    scheduler.result(variables['seed'], result)
+                source.done(variables['seed'])
+                if result != 0:
+                    exemplar = buckets.add(signature, variables['seed'])
+                    if exemplars is not None and not exemplar:
+                        print >>sys.stderr, '%s: seed "%s" failed like the others in bucket %s' % (modName, variables['seed'], signature)
+                        if logDir is not None and os.path.exists(logPath(logDir, variables['seed'])):
+                            os.remove(logPath(logDir, variables['seed']))
+                    elif archive is not None:
+                        # The archive keeps its artifacts, so its test directory needn't be.
+                        archived.append((variables, result, signature))
+                    elif exemplars is None:
+                        w.keepTestDirectory = True
+                    else:
+                        keep = variables['seed']
+                    if exemplars is None or exemplar:
+                        if logDir is not None and w.batch is None:
+                            print >>sys.stderr, '%s: last output of seed "%s" (all of it is in %s):' % (modName, variables['seed'], logPath(logDir, variables['seed']))
+                            sys.stderr.write(w.test.outputTail)
+                        # Print the variables for this failed test.
+                        for k, v in variables.iteritems():
+                            print >>sys.stderr, '%s: %s "%s"' % (modName, k, v)
+                        print >>sys.stderr, '%s: bucket %s' % (modName, signature)
+                    noteFailure(variables['seed'], timedOut)
+            if repos and repos.reposChangedSince():
+                stopWork.set()
+        for (variables, result, signature) in archived:
+            archiveSeed(w, variables, result, signature, timedOut)
+        if keep is not None:
+            setAside(w, keep)
+
+def coordinatorResult(report):
+    ''' Record the result of a seed run by a worker process. '''
+    modName = __name__ + '.coordinatorResult'
+    seed = report['seed']
+    result = report['result']
+    timedOut = report.get('timedout', False)
+    signature = report.get('signature')
+    records = report.get('records', [])
+    for record in records:
+        stats.record(record)
+    stats.seedDone(1, 1 if timedOut else 0, 1 if report.get('skipped') else 0, 1 if result != 0 else 0)
+    if database is not None:
+        database.seedDone(seed, result, timedOut, records, signature, report.get('skipped', False))
+    with workLock:
+        if scheduler is not None:
+            scheduler.result(seed, result)
+        source.done(seed)
+        if result != 0:
+            buckets.add(signature, seed)
+            print >>sys.stderr, '%s: seed "%s" failed on %s (bucket %s)' % (modName, seed, report.get('worker'), signature)
+            noteFailure(seed, timedOut)
+
+def collectMetrics(workers, repos):
+    ''' Return our metrics, as a list of lines in the Prometheus text format (for our metricsServer). '''
+    name = metricsPrefix + '_current_seed'
+    lines = stats.metrics(metricsPrefix)
+    lines += metric(name, 'gauge', 'The seeds each worker is running.',
+                    [sample(name, 1, [('worker', w.number), ('seed', s)]) for w in workers for s in w.seeds])
+    if repos:
+        polls = []
+        failed = []
+        changed = []
+        for path, repo in sorted(repos.repoMap.items()):
+            if repo.lastPoll is not None:
+                polls.append(sample(metricsPrefix + '_repo_last_poll_timestamp_seconds', repo.lastPoll, [('repo', path)]))
+            failed.append(sample(metricsPrefix + '_repo_poll_failed', 0 if repo.pollError is None else 1, [('repo', path)]))
+            changed.append(sample(metricsPrefix + '_repo_changed', repo.isChanged() if repo.connected else 0, [('repo', path)]))
+        lines += metric(metricsPrefix + '_repo_last_poll_timestamp_seconds', 'gauge', 'When we last asked for the head of each repo.', polls)
+        lines += metric(metricsPrefix + '_repo_poll_failed', 'gauge', 'Did the last poll of each repo fail?', failed)
+        lines += metric(metricsPrefix + '_repo_changed', 'gauge', 'Has each repo changed since we started?', changed)
+    depths = []
+    if scheduler is not None:
+        depths.append(('replay', len(scheduler.replay)))
+    if coordinator is not None:
+        depths.append(('requeued', len(coordinator.requeued)))
+        depths.append(('leased', sum([len(l.seeds) for l in coordinator.leases.values()])))
+    if database is not None:
+        depths.append(('database', database.queue.qsize()))
+    name = metricsPrefix + '_queue_depth'
+    lines += metric(name, 'gauge', 'Seeds waiting to be replayed or reassigned, or leased to workers, and results waiting to be written to the database.',
+                    [sample(name, depth, [('queue', queue)]) for (queue, depth) in depths])
+    return lines
+
+def nextSeed():
+    ''' Return the next seed for the coordinator to hand out, or None. '''
+    variables = updateVariables()
+    if variables is None:
+        return None
+    return variables['seed']
+
 def doWork(paths, period, verbose):
-    modName = __name__ + '.doWork'
     variables = initVariables()
     if variables is None:
         print 'no variables'
@@ -229,38 +628,193 @@ def doWork(paths, period, verbose):
     
     repos = None
     if len(paths) > 0:
-        repos = MonitorRepos(paths, period)
+        repos = MonitorRepos(paths, period, backend=backend)
         if repos is None:
             exit(1)
+        if webhookPort is not None:
+            repos.listen(webhookPort, os.environ['GHWHSECRET'], verbose)
     
-    test = testRun(verbose)
-    locate(test, variables)
-    
-    result = 0
-    keepTestDirectory = False
-    while (result == 0 or continueOnError) and not doExit:
-        newVariables = updateVariables()
-        if newVariables is None:
-            break
-        for k, v in newVariables.iteritems():
-            variables[k] = v
-        result = runATest(test, variables)
-        if result != 0:
-            keepTestDirectory = True
-            # Print the variables for this failed test.
-            for k, v in variables.iteritems():
-                print >>sys.stderr, '%s: %s "%s"' % (modName, k, v)
-            if badSeedFile is not None:
-                badSeedFile.write(variables['seed'] + '\n')
-        if repos and repos.reposChangedSince():
-            break
+    global source
+    source = openSeeds(seed, homeDir, shard, checkpointEvery)
+
+    global stats
+    stats = runStats(statsFile)
+
+    global buckets
+    buckets = failureBuckets(exemplars if exemplars is not None else 1)
+
+    global database
+    if databasePath is not None:
+        database = runDatabase(databasePath)
+        if repos:
+            database.heads(repos)
+
+    global scheduler
+    if replayLimit > 0 and database is not None:
+        replay = replayOrder(database.failures(), replayLimit)
+        print >>sys.stderr, 'citSupport: replaying %d previously failing seeds first' % (len(replay))
+        scheduler = seedScheduler(replay, seed_generator)
+        testVariableFUNC['seed'] = scheduler.next
+
+    global coordinator, client
+    if coordinatorAddress is not None:
+        coordinator = seedCoordinator(nextSeed, coordinatorResult, coordinatorAddress[1], coordinatorAddress[0], leaseSeconds, verbose)
+    elif workerAddress is not None:
+        # Take our seeds from the coordinator, enough at a time to keep all our workers busy.
+        client = coordinatorClient(workerAddress[0], workerAddress[1], '%s:%d' % (socket.gethostname(), os.getpid()), jobs * batchSize)
+        testVariableFUNC['seed'] = client.next
+
+    global logDir
+    if logDir is not None:
+        logDir = os.path.join(homeDir, logDir)
+        try:
+            os.makedirs(logDir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    global pipelineStages
+    if stageLimits is not None:
+        # Stages without a limit are limited only by the number of workers.
+        pipelineStages = [(first, threading.Semaphore(stageLimits.get(name, jobs))) for (name, first) in testStages]
+
+    cache = None
+    if cacheDir is not None:
+        cache = stepCache(cacheDir, cacheMegabytes * 1024 * 1024, cacheSalt(repos), verbose)
+
+    global archive
+    if archiveDir is not None:
+        archive = failureArchive(os.path.join(homeDir, archiveDir), archiveMegabytes * 1024 * 1024, verbose)
+
+    global designs
+    if designPath is not None:
+        designs = designIndex(os.path.join(homeDir, designPath), cacheSalt(repos), designMaxEntries)
+
+    # A coordinator runs no seeds of its own.
+    global workers
+    workers = [worker(n, variables, verbose) for n in range(jobs if coordinator is None else 0)]
+    global workspaces
+    if workspaceRoot is not None and len(workers) > 0:
+        def setup(directory):
+            locate(testRun(verbose), dict(variables, testDir=directory))
+        workspaces = workspacePool(workspaceRoot, homeDir, setup, seedOutputs, canaryFileName, verbose)
+    for w in workers:
+        if workspaces is not None:
+            w.variables['testDir'] = workspaces.acquire()
+            w.test.cwd = w.variables['testDir']
+        else:
+            locate(w.test, w.variables)
+        w.test.cache = cache
+        if useJvmServer:
+            w.test.server = jvmServer(classPath, w.variables['testDir'], verbose)
+
+    stopWork.clear()
+    if repos:
+        def repoChanged():
+            ''' Stop handing out seeds, and abandon the ones in progress if we're preempting. '''
+            stopWork.set()
+            if coordinator is not None:
+                coordinator.stop()
+            if preempt:
+                for w in workers:
+                    w.test.abort()
+        repos.start(repoChanged)
+
+    metrics = None
+    if metricsAddress is not None:
+        metrics = metricsServer(lambda: collectMetrics(workers, repos), metricsAddress[1], metricsAddress[0], verbose)
+        metrics.start()
+        print >>sys.stderr, 'citSupport: serving metrics on port %d' % (metrics.port)
+
+    for w in workers:
+        w.thread = threading.Thread(target=runWorker, args=(w, repos), name='worker%d' % (w.number))
+        w.thread.daemon = True
+        w.thread.start()
+
+    # Wait for the workers with a timeout, so we can still see signals.
+    for w in workers:
+        while w.thread.is_alive():
+            w.thread.join(1.0)
+    if coordinator is not None:
+        coordinator.start()
+        print >>sys.stderr, 'citSupport: coordinating on port %d' % (coordinator.port)
+        while not coordinator.finished() and not stopWork.is_set() and not doExit:
+            stopWork.wait(1.0)
+        coordinator.stop()
+        coordinator.shutdown()
+        print >>sys.stderr, 'citSupport: %d seeds reassigned from lost workers' % (coordinator.reassigned)
+    if client is not None:
+        client.close()
+    if metrics is not None:
+        metrics.stop()
+    if repos:
+        repos.stop()
     
+    source.close()
     if badSeedFile is not None:
         badSeedFile.close()
+    if timeoutSeedFile is not None:
+        timeoutSeedFile.close()
+
+    if cache is not None:
+        print >>sys.stderr, cache.report()
+    print >>sys.stderr, stats.summary()
+    stats.close()
+    if len(buckets.buckets) > 0:
+        print >>sys.stderr, buckets.report()
+    if scheduler is not None:
+        print >>sys.stderr, scheduler.report()
+    if designs is not None:
+        print >>sys.stderr, designs.report()
+        designs.close()
+    if archive is not None:
+        print >>sys.stderr, archive.report()
+    if database is not None:
+        database.close()
+        database = None
 
-    os.chdir(homeDir)
-    if not keepTestDirectory:
-        cleanup(test, variables)
+    for w in workers:
+        w.test.aborted = False
+        if w.test.server is not None:
+            w.test.server.stop()
+            w.test.server = None
+        if workspaces is not None:
+            # Leave it set up for next time, unless there's a failure in it.
+            if w.keepTestDirectory:
+                print >>sys.stderr, 'citSupport: %s kept in %s' % (w.variables['testDir'], workspaces.keep(w.variables['testDir'], '%s.%d' % (testDir, w.number)))
+            else:
+                workspaces.release(w.variables['testDir'])
+        elif not w.keepTestDirectory:
+            cleanup(w.test, w.variables)
+    if workspaces is not None:
+        workspaces.close()
+
+def bisect(paths, verbose):
+    ''' Find the commits which introduced the failures that appeared when the repos last changed. '''
+    modName = __name__ + '.bisect'
+    (oldHeads, newHeads, suspects) = regressions(databasePath, exemplars if exemplars is not None else 1)
+    if len(suspects) == 0:
+        print >>sys.stderr, '%s: no new failures since the repos last changed' % (modName)
+        return
+    print >>sys.stderr, '%s: %d new failure buckets' % (modName, len(suspects))
+    for path in paths:
+        if path not in oldHeads or path not in newHeads or oldHeads[path] == newHeads[path]:
+            continue
+        directory = os.path.join(homeDir, 'bisect.%s' % (unsafeRE.sub('_', os.path.basename(path))))
+        b = commitBisect(path, oldHeads[path], newHeads[path], suspects, directory, jobs,
+                         bisectBuildCommands, bisectJars, classPath, setupCommands, testCommands,
+                         commandTimeout, seedTimeout, verbose)
+        try:
+            b.run()
+        finally:
+            b.close()
+        print b.report()
+        # A failure which was already there at the old head of this repo may have come with another.
+        suspects = b.unexplained()
+        if len(suspects) == 0:
+            break
+    for bucket in suspects.keys():
+        print >>sys.stderr, '%s: bucket %s didn\'t start failing in any repo we bisected' % (modName, bucket)
 
 def main(argv=None): # IGNORE:C0111
     '''Command line options.'''
@@ -291,6 +845,27 @@ USAGE
 
     global classPath, defaultClassPath
     global continueOnError
+    global jobs
+    global useJvmServer
+    global batchSize
+    global cacheDir, cacheMegabytes
+    global preempt
+    global webhookPort
+    global backend
+    global statsFile
+    global stageLimits
+    global commandTimeout, seedTimeout, continueOnTimeout, timeoutSeedFile
+    global logDir, logSample, logTailLines
+    global databasePath
+    global exemplars
+    global replayLimit
+    global coordinatorAddress, workerAddress, leaseSeconds
+    global shard, checkpointEvery
+    global workspaceRoot
+    global designPath, designMaxEntries
+    global bisectMode
+    global metricsAddress
+    global archiveDir, archiveMegabytes
     try:
         # Setup argument parser
         parser = ArgumentParser(description=program_license, formatter_class=RawDescriptionHelpFormatter)
@@ -301,6 +876,38 @@ USAGE
         parser.add_argument('-C', '--classpath', dest='classPath', help='additional classpath for jars to use for testing [default: %(default)s]', type=str, default=defaultClassPath)
         parser.add_argument('-s', '--seed', dest='seed', help='seed (or file containing seeds', type=str, default=None)
         parser.add_argument('-b', '--badseed', dest='badseed', help='file to contain list of bad seeds', type=FileType('w'), default=None)
+        parser.add_argument('-j', '--jobs', dest='jobs', help='number of seeds to run concurrently [default: %(default)s]', type=int, default=jobs)
+        parser.add_argument('-J', '--jvmserver', dest='useJvmServer', help='run scalac/scala commands in a persistent JVM server [default: %(default)s]', action='store_true', default=useJvmServer)
+        parser.add_argument('-k', '--batch', dest='batchSize', help='number of seeds to compile and run together [default: %(default)s]', type=int, default=batchSize)
+        parser.add_argument('--cache', dest='cacheDir', help='directory in which to cache the outputs of cacheable commands [default: %(default)s]', type=str, default=cacheDir)
+        parser.add_argument('--cachesize', dest='cacheMegabytes', help='maximum size of the cache (in megabytes) [default: %(default)s]', type=int, default=cacheMegabytes)
+        parser.add_argument('--preempt', dest='preempt', help='abandon the seeds in progress when a repo changes [default: %(default)s]', action='store_true', default=preempt)
+        parser.add_argument('-w', '--webhook', dest='webhookPort', help='port on which to accept GitHub push webhooks (signed with the secret in GHWHSECRET) [default: %(default)s]', type=int, default=webhookPort)
+        parser.add_argument('--backend', dest='backend', help='how to check repos for changes: the GitHub API, or git ls-remote (a path ending with #github or #git overrides this) [default: %(default)s]', choices=['github', 'git'], default=backend)
+        parser.add_argument('--stats', dest='statsFile', help='file to contain a record (in JSON) of each command run [default: %(default)s]', type=FileType('w'), default=statsFile)
+        parser.add_argument('--stages', dest='stages', help='pipeline seeds, with at most this many seeds in each stage (%s) at once, e.g. generate=2,simulate=4 [default: %%(default)s]' % (', '.join([name for (name, first) in testStages])), type=str, default=None)
+        parser.add_argument('-t', '--timeout', dest='commandTimeout', help='seconds each command may run before it is killed [default: %(default)s]', type=float, default=commandTimeout)
+        parser.add_argument('-T', '--seedtimeout', dest='seedTimeout', help='seconds all the commands for a seed may run before they are killed [default: %(default)s]', type=float, default=seedTimeout)
+        parser.add_argument('--continuetimeout', dest='continueOnTimeout', help='continue when a seed times out (even without --continue) [default: %(default)s]', action='store_true', default=continueOnTimeout)
+        parser.add_argument('--timeoutseed', dest='timeoutseed', help='file to contain list of seeds that timed out (instead of the bad seed file)', type=FileType('w'), default=None)
+        parser.add_argument('--logdir', dest='logDir', help='directory to contain a compressed log of the output of each seed (instead of printing it) [default: %(default)s]', type=str, default=logDir)
+        parser.add_argument('--logsample', dest='logSample', help='fraction of the logs of passing seeds to keep [default: %(default)s]', type=float, default=logSample)
+        parser.add_argument('--logtail', dest='logTailLines', help='number of lines of stdout and stderr to print when a seed fails [default: %(default)s]', type=int, default=logTailLines)
+        parser.add_argument('--database', dest='databasePath', help='SQLite database in which to record the results of each seed (query it with runDatabase.py) [default: %(default)s]', type=str, default=databasePath)
+        parser.add_argument('--exemplars', dest='exemplars', help='keep the test directories of (and fully report) only this many seeds with each failure signature (needs --logdir) [default: %(default)s]', type=int, default=exemplars)
+        parser.add_argument('--replay', dest='replayLimit', help='first run (up to) this many of the seeds which failed before (needs --database) [default: %(default)s]', type=int, default=replayLimit)
+        parser.add_argument('--coordinator', dest='coordinator', help='hand out seeds to worker processes (run with --worker) listening on [host:]port, instead of running them [default: %(default)s]', type=str, default=None)
+        parser.add_argument('--worker', dest='worker', help='run the seeds handed out by the coordinator at host:port [default: %(default)s]', type=str, default=None)
+        parser.add_argument('--lease', dest='leaseSeconds', help='seconds a worker may hold seeds without renewing its lease [default: %(default)s]', type=int, default=leaseSeconds)
+        parser.add_argument('--shard', dest='shard', help='run only the i\'th of n parts of the seed file [default: 0/1]', type=str, default=None)
+        parser.add_argument('--checkpoint', dest='checkpointEvery', help='remember how far through the seed file we are (in <seed file>.checkpoint) every this many seeds, and resume from there [default: %(default)s]', type=int, default=checkpointEvery)
+        parser.add_argument('--workspaces', dest='workspaceRoot', help='directory (perhaps on tmpfs) for a pool of reusable test directories; failing ones are moved to the current directory [default: %(default)s]', type=str, default=workspaceRoot)
+        parser.add_argument('--designs', dest='designPath', help='file in which to remember the designs tested with the current repo heads, so seeds generating the same design are skipped [default: %(default)s]', type=str, default=designPath)
+        parser.add_argument('--designsize', dest='designMaxEntries', help='maximum number of designs to remember [default: %(default)s]', type=int, default=designMaxEntries)
+        parser.add_argument('--bisect', dest='bisectMode', help='find the commits (of the repos in paths) which introduced the failures that appeared when they last changed, instead of running seeds (needs --database) [default: %(default)s]', action='store_true', default=bisectMode)
+        parser.add_argument('--archive', dest='archiveDir', help='directory in which to archive the artifacts (and logs) of failing seeds, instead of keeping their test directories [default: %(default)s]', type=str, default=archiveDir)
+        parser.add_argument('--archivesize', dest='archiveMegabytes', help='maximum size of the archive (in megabytes), beyond which the oldest seeds are removed [default: %(default)s]', type=int, default=archiveMegabytes)
+        parser.add_argument('--metrics', dest='metrics', help='serve metrics (for Prometheus) on [host:]port/metrics [default: %(default)s]', type=str, default=None)
         parser.add_argument(dest="paths", help="paths to folders containing clones of github repositories to be tested [default: %(default)s]",  default=None, metavar="path", nargs='*')
 
         # Process arguments
@@ -311,6 +918,67 @@ USAGE
         global badSeedFile
         badSeedFile = args.badseed
         continueOnError = args.continueOnError
+        jobs = args.jobs
+        useJvmServer = args.useJvmServer
+        batchSize = args.batchSize
+        cacheDir = args.cacheDir
+        cacheMegabytes = args.cacheMegabytes
+        preempt = args.preempt
+        webhookPort = args.webhookPort
+        backend = args.backend
+        statsFile = args.statsFile
+        commandTimeout = args.commandTimeout
+        seedTimeout = args.seedTimeout
+        continueOnTimeout = args.continueOnTimeout
+        timeoutSeedFile = args.timeoutseed
+        logDir = args.logDir
+        logSample = args.logSample
+        logTailLines = args.logTailLines
+        databasePath = args.databasePath
+        exemplars = args.exemplars
+        replayLimit = args.replayLimit
+        leaseSeconds = args.leaseSeconds
+        checkpointEvery = args.checkpointEvery
+        workspaceRoot = args.workspaceRoot
+        designPath = args.designPath
+        designMaxEntries = args.designMaxEntries
+        bisectMode = args.bisectMode
+        archiveDir = args.archiveDir
+        archiveMegabytes = args.archiveMegabytes
+        if args.shard is not None:
+            try:
+                shard = parseShard(args.shard)
+            except ValueError as e:
+                raise CLIError(str(e))
+        if args.metrics is not None:
+            metricsAddress = parseAddress(args.metrics)
+        if args.coordinator is not None:
+            coordinatorAddress = parseAddress(args.coordinator)
+        if args.worker is not None:
+            workerAddress = parseAddress(args.worker)
+            if coordinatorAddress is not None:
+                raise CLIError('--worker and --coordinator are exclusive')
+            if args.seed is not None or replayLimit > 0:
+                raise CLIError('a --worker gets its seeds from the coordinator')
+        if bisectMode and databasePath is None:
+            raise CLIError('--bisect needs --database')
+        if replayLimit > 0 and databasePath is None:
+            raise CLIError('--replay needs --database')
+        if exemplars is not None and exemplars < 1:
+            raise CLIError('--exemplars must be at least 1')
+        # Failures are told apart by the end of their output, which we only see with a log.
+        if exemplars is not None and logDir is None and coordinatorAddress is None and not bisectMode:
+            raise CLIError('--exemplars needs --logdir')
+        if args.stages is not None:
+            stageLimits = parseStageLimits(args.stages)
+            # We need enough seeds in flight to fill every stage.
+            jobs = max(jobs, sum([stageLimits.get(name, 1) for (name, first) in testStages]))
+        if webhookPort is not None and 'GHWHSECRET' not in os.environ:
+            raise CLIError('environment variable GHWHSECRET is not set')
+        if batchSize < 1:
+            raise CLIError('--batch must be at least 1')
+        if jobs < 1:
+            raise CLIError('--jobs must be at least 1')
 
         global seed
         seed = args.seed
@@ -320,12 +988,19 @@ USAGE
 
         # Install the signal handler to catch SIGTERM
         signal.signal(signal.SIGTERM, sigterm)
+        signal.signal(signal.SIGUSR1, sigusr1)
         period = timedelta(minutes = args.periodMinutes)
+        if bisectMode:
+            bisect(paths, verbose)
+            return 0
         doWork(paths, period, verbose)
         return 0
  
     except KeyboardInterrupt:
         ### handle keyboard interrupt ###
+        # Don't leave our commands (in sessions of their own) running without us.
+        abortWorkers()
+        waitForWorkers(killGrace + 1)
         return 0
     except Exception, e:
         if DEBUG or TESTRUN:
@@ -0,0 +1,272 @@
+'''
+Created on Oct 18, 2026
+'''
+import errno
+import glob
+import hashlib
+import os
+import Queue
+import shutil
+import sys
+import threading
+
+from git import Repo, GitCommandError
+from failureBuckets import fingerprint
+from seedLog import seedLog
+from testRun import testRun
+
+# The hash of an empty stderr tail: the signature of a failure recorded without a log.
+noOutputDigest = hashlib.sha1('').hexdigest()[:12]
+
+def clonePath(path):
+    ''' Return the local clone named by a repo path (which may end with :branch and/or #backend). '''
+    path = path.partition('#')[0]
+    (gitrepo, sep, branch) = path.rpartition(':')
+    return gitrepo if sep != '' else branch
+
+def sameFailure(signature, bucket):
+    ''' Does a failure with signature belong in bucket?
+    A bucket recorded without a log (or a command record) says less about its failures, so we compare less.
+    '''
+    if bucket is None:
+        return True
+    (index, result, digest) = bucket.split(':')
+    if index == '-1':
+        return True
+    mine = signature.split(':')
+    if digest == noOutputDigest:
+        return mine[:2] == [index, result]
+    return signature == bucket
+
+class suspect():
+    ''' Where a failure bucket started failing, as far as we know: commits[good] passes
+    (the old head is assumed to, until we've tried it) and commits[bad] fails.
+    '''
+
+    def __init__(self, bucket, seeds, count):
+        self.bucket = bucket
+        self.seeds = seeds
+        self.good = 0
+        self.bad = count - 1
+        self.triedOldHead = False
+        self.skipped = set()
+        # What we found, and was it the commit which introduced the failure?
+        self.outcome = None
+        self.found = False
+
+    def candidates(self):
+        return [i for i in range(self.good + 1, self.bad) if i not in self.skipped]
+
+    def probes(self, k):
+        ''' Return (up to) k commits to try next, spread evenly through the candidates. '''
+        candidates = self.candidates()
+        probes = []
+        if not self.triedOldHead:
+            probes.append(0)
+            k = max(1, k - 1)
+        if len(candidates) <= k:
+            probes.extend(candidates)
+        else:
+            for j in range(k):
+                i = candidates[(j + 1) * len(candidates) / (k + 1)]
+                if i not in probes:
+                    probes.append(i)
+        return probes
+
+    def update(self, results):
+        ''' Narrow the range with results, a map of commit index to True (fails), False (passes) or None (didn't build). '''
+        if 0 in results:
+            self.triedOldHead = True
+            if results[0]:
+                self.outcome = 'already fails at the old head'
+                return
+        for i, bad in results.iteritems():
+            if bad is None:
+                self.skipped.add(i)
+            elif bad and i < self.bad:
+                self.bad = i
+        for i, bad in results.iteritems():
+            # Ignore a pass after the first failure (a flaky seed).
+            if bad is False and self.good < i < self.bad:
+                self.good = i
+
+class probeSlot():
+    ''' A git worktree in which candidate commits are checked out and built, and a test directory. '''
+
+    def __init__(self, number, directory):
+        self.worktree = os.path.join(directory, 'wt.%d' % (number))
+        self.testDir = os.path.join(directory, 'test.%d' % (number))
+
+class commitBisect():
+    ''' Find the commit (between good and bad) in the repo at path which introduced each of a number of failures.
+    suspects maps the signature (see failureBuckets) of each failure to the seeds which failed that way.
+    Candidate commits are checked out in up to slots git worktrees (in directory) and built there
+    with buildCommands, then the seeds are run with the jars the build produced (jars, a glob pattern
+    relative to the worktree) ahead of classPath. Each round tries several commits at once (at most
+    slots of them), spread evenly through the range where each failure may have started, so a range
+    of n commits takes about log(n)/log(slots + 1) rounds, rather than log2(n).
+    '''
+
+    def __init__(self, path, good, bad, suspects, directory, slots, buildCommands, jars, classPath,
+                 setupCommands, testCommands, commandTimeout = None, seedTimeout = None, verbose = 0):
+        self.path = path
+        self.repo = Repo(clonePath(path))
+        self.directory = os.path.abspath(directory)
+        self.buildCommands = buildCommands
+        self.jars = jars
+        self.classPath = classPath
+        self.setupCommands = setupCommands
+        self.testCommands = testCommands
+        self.commandTimeout = commandTimeout
+        self.seedTimeout = seedTimeout
+        self.verbose = verbose
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # The old head, then the commits after it (following the branch's first parents), ending with the new head.
+        self.commits = [good] + self.repo.git.rev_list('--first-parent', '--reverse', '%s..%s' % (good, bad)).split()
+        self.suspects = [suspect(bucket, seeds, len(self.commits)) for bucket, seeds in suspects.iteritems()]
+        self.slots = [probeSlot(n, self.directory) for n in range(max(1, min(slots, len(self.commits))))]
+        self.gitLock = threading.Lock()
+        self.rounds = 0
+        self.builds = 0
+
+    def checkout(self, slot, commit):
+        ''' Check out commit in slot's worktree (creating it if need be). '''
+        with self.gitLock:
+            if not os.path.isdir(slot.worktree):
+                self.repo.git.worktree('add', '--detach', slot.worktree, commit)
+                return
+        Repo(slot.worktree).git.checkout('--detach', '--force', commit)
+
+    def build(self, slot, commit):
+        ''' Check out and build commit in slot. Return the classpath to test it with, or None if it won't build. '''
+        modName = 'commitBisect.build'
+        try:
+            self.checkout(slot, commit)
+        except GitCommandError as e:
+            print >>sys.stderr, '%s: can\'t check out %s: %s' % (modName, commit, e)
+            return None
+        test = testRun(self.verbose, cwd=slot.worktree, commandTimeout=self.commandTimeout)
+        log = seedLog(self.directory, 'build.%s' % (commit[:10]))
+        test.log = log
+        result = test.run(self.buildCommands, {})
+        self.builds += 1
+        log.close(result != 0)
+        if result != 0:
+            print >>sys.stderr, '%s: %s doesn\'t build (see %s)' % (modName, commit[:10], log.path)
+            return None
+        jars = sorted(glob.glob(os.path.join(slot.worktree, self.jars)))
+        return ':'.join(jars + [self.classPath])
+
+    def runSeed(self, slot, classPath, seed):
+        ''' Run seed in a fresh test directory. Return its failure signature, or None if it passes. '''
+        shutil.rmtree(slot.testDir, ignore_errors=True)
+        os.mkdir(slot.testDir)
+        variables = { 'classpath' : classPath, 'testDir' : slot.testDir, 'seed' : seed }
+        test = testRun(self.verbose, cwd=slot.testDir, commandTimeout=self.commandTimeout, seedTimeout=self.seedTimeout)
+        test.run(self.setupCommands, variables)
+        log = seedLog(self.directory, os.path.basename(slot.testDir))
+        test.log = log
+        result = test.run(self.testCommands, variables)
+        log.close(False)
+        if result == 0:
+            return None
+        return fingerprint(test.records, result, test.stderrTail, variables)
+
+    def probe(self, slot, index, suspects):
+        ''' Try commits[index] for each of suspects. Return a map of suspect to True (fails), False or None. '''
+        commit = self.commits[index]
+        classPath = self.build(slot, commit)
+        results = {}
+        for s in suspects:
+            if classPath is None:
+                results[s] = None
+                continue
+            results[s] = False
+            for seed in s.seeds:
+                signature = self.runSeed(slot, classPath, seed)
+                if signature is not None and sameFailure(signature, s.bucket):
+                    results[s] = True
+                    break
+        if self.verbose > 0:
+            print >>sys.stderr, 'commitBisect.probe: %s %s' % (commit[:10], ' '.join(['%s=%s' % (s.bucket, results[s]) for s in suspects]))
+        return results
+
+    def round(self, wanted):
+        ''' Try the commits in wanted (a map of commit index to the suspects to try there) concurrently, one per slot.
+        Return a map of commit index to the results of probe().
+        '''
+        work = Queue.Queue()
+        for item in wanted.iteritems():
+            work.put(item)
+        results = {}
+        def runSlot(slot):
+            while True:
+                try:
+                    (index, suspects) = work.get_nowait()
+                except Queue.Empty:
+                    return
+                results[index] = self.probe(slot, index, suspects)
+        threads = [threading.Thread(target=runSlot, args=(slot,), name='commitBisect%d' % (n))
+                   for n, slot in enumerate(self.slots[:len(wanted)])]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(1.0)
+        return results
+
+    def run(self):
+        ''' Narrow the range of each suspect until we know its first bad commit. '''
+        while True:
+            active = [s for s in self.suspects if s.outcome is None]
+            wanted = {}
+            for n, s in enumerate(active):
+                # Share the slots between the failures we're still looking for.
+                k = max(1, len(self.slots) / len(active) + (1 if n < len(self.slots) % len(active) else 0))
+                probes = s.probes(k)
+                if len(probes) == 0:
+                    s.outcome = self.describe(s)
+                    s.found = True
+                for index in probes:
+                    wanted.setdefault(index, []).append(s)
+            if len(wanted) == 0:
+                return
+            self.rounds += 1
+            print >>sys.stderr, 'commitBisect: round %d, trying %d of %d commits in %s' % (self.rounds, len(wanted), len(self.commits), self.path)
+            results = self.round(wanted)
+            for s in active:
+                s.update(dict([(index, results[index][s]) for index in wanted.keys() if s in wanted[index]]))
+
+    def describe(self, s):
+        ''' Describe the first bad commit of a suspect whose range we've narrowed as far as we can. '''
+        first = self.repo.git.log('-1', '--format=%h %an: %s', self.commits[s.bad])
+        untested = [self.commits[i][:10] for i in range(s.good + 1, s.bad)]
+        if len(untested) > 0:
+            return 'first bad commit is %s, or one of %s (which don\'t build)' % (first, ' '.join(untested))
+        return 'first bad commit is %s' % (first)
+
+    def unexplained(self):
+        ''' Return the suspects (as a map of bucket to seeds) which didn't start failing in this range. '''
+        return dict([(s.bucket, s.seeds) for s in self.suspects if not s.found])
+
+    def report(self):
+        lines = ['commitBisect: %s %s..%s, %d commits, %d rounds, %d builds'
+                 % (self.path, self.commits[0][:10], self.commits[-1][:10], len(self.commits) - 1, self.rounds, self.builds)]
+        for s in self.suspects:
+            lines.append('%-24s %s (seed %s)' % (s.bucket, s.outcome, ' '.join(s.seeds)))
+        return '\n'.join(lines)
+
+    def close(self):
+        ''' Remove our worktrees. '''
+        for slot in self.slots:
+            shutil.rmtree(slot.worktree, ignore_errors=True)
+            shutil.rmtree(slot.testDir, ignore_errors=True)
+        try:
+            self.repo.git.worktree('prune')
+        except GitCommandError as e:
+            print >>sys.stderr, 'commitBisect.close: %s' % (e)
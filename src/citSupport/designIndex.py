@@ -0,0 +1,100 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import hashlib
+import os
+import re
+import threading
+
+commentRE = re.compile(r';.*$', re.MULTILINE)
+infoRE = re.compile(r'@\[[^\]]*\]')
+spaceRE = re.compile(r'[ \t]+')
+# The statements which name something (a circuit, module, port, wire, register, node or instance).
+declarationRE = re.compile(r'\b(?:circuit|module|extmodule|input|output|wire|reg|node|inst|mem)\s+(\w+)')
+wordRE = re.compile(r'\b[A-Za-z_]\w*\b')
+
+def canonicalize(text):
+    ''' Return a canonical form of a FIRRTL design: without comments, source locators or
+    extra white space, and with everything it declares renamed in order of declaration,
+    so designs differing only in those respects are the same.
+    '''
+    text = commentRE.sub('', text)
+    text = infoRE.sub('', text)
+    lines = [spaceRE.sub(' ', line).rstrip() for line in text.splitlines()]
+    text = '\n'.join([line for line in lines if line.strip() != ''])
+    names = {}
+    for name in declarationRE.findall(text):
+        if name not in names:
+            names[name] = '_%d' % (len(names))
+    return wordRE.sub(lambda m: names.get(m.group(0), m.group(0)), text)
+
+def designHash(path):
+    with open(path, 'r') as f:
+        return hashlib.sha1(canonicalize(f.read())).hexdigest()
+
+class designIndex():
+    ''' A persistent index of (the hashes of) the designs we've tested with the current tools.
+    The index is kept in a file whose first line identifies the tools (the salt): if they've
+    changed, we start again. It holds at most maxEntries designs, forgetting the oldest first.
+    '''
+
+    def __init__(self, path, salt, maxEntries = 100000):
+        self.path = path
+        self.salt = hashlib.sha1(salt).hexdigest()
+        self.maxEntries = maxEntries
+        self.lock = threading.Lock()
+        self.designs = collections.OrderedDict()
+        self.skipped = 0
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                if f.readline().strip() == self.salt:
+                    for line in f:
+                        self.remember(line.strip())
+        self.rewrite()
+
+    def remember(self, design):
+        self.designs.pop(design, None)
+        self.designs[design] = True
+        while len(self.designs) > self.maxEntries:
+            self.designs.popitem(last=False)
+
+    def rewrite(self):
+        ''' Write the index afresh (atomically). (We hold our lock, or no one else has us yet.) '''
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.salt + '\n')
+            for design in self.designs.iterkeys():
+                f.write(design + '\n')
+        os.rename(tmp, self.path)
+        self.file = open(self.path, 'a')
+        self.written = len(self.designs)
+
+    def seen(self, design):
+        ''' Have we tested this design? '''
+        with self.lock:
+            if design in self.designs:
+                self.skipped += 1
+                return True
+            return False
+
+    def add(self, design):
+        ''' Note that we've tested a design. '''
+        with self.lock:
+            if design in self.designs:
+                return
+            self.remember(design)
+            self.file.write(design + '\n')
+            self.file.flush()
+            self.written += 1
+            # Don't let the file grow without bound.
+            if self.written > 2 * self.maxEntries:
+                self.file.close()
+                self.rewrite()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def report(self):
+        return 'designIndex: %d designs, %d seeds skipped as duplicates' % (len(self.designs), self.skipped)
@@ -0,0 +1,240 @@
+'''
+Created on Oct 18, 2026
+'''
+from argparse import ArgumentParser
+import collections
+import errno
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+# How much of a file we read (or compress) at a time.
+chunkSize = 1024 * 1024
+unsafeRE = re.compile(r'[^\w.-]')
+
+def fileHash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunkSize), ''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def makeDirectory(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+class failureArchive():
+    ''' Keep the artifacts of failing seeds in a content addressed store.
+    Each file is stored (compressed, as a stream) once, under the hash of its contents,
+    however many seeds left it behind, and each seed has a manifest naming its files.
+    The store is kept under maxBytes by removing the manifests of the oldest seeds,
+    and any files no other seed needs.
+    '''
+
+    def __init__(self, root, maxBytes, verbose = 0):
+        self.root = os.path.abspath(root)
+        self.blobDir = os.path.join(self.root, 'blobs')
+        self.manifestDir = os.path.join(self.root, 'seeds')
+        self.maxBytes = maxBytes
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        makeDirectory(self.blobDir)
+        makeDirectory(self.manifestDir)
+        # The hashes of the files of each seed, and the size of its manifest, oldest first.
+        self.manifests = collections.OrderedDict()
+        # The number of seeds with each file, and the size of its blob.
+        self.refs = {}
+        self.sizes = {}
+        self.total = 0
+        self.added = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.load()
+
+    def blobPath(self, digest):
+        return os.path.join(self.blobDir, digest[:2], digest[2:] + '.gz')
+
+    def manifestPath(self, name):
+        return os.path.join(self.manifestDir, unsafeRE.sub('_', name) + '.json')
+
+    def load(self):
+        ''' Find what's in the store, and remove anything left half done. '''
+        manifests = []
+        for path in glob.glob(os.path.join(self.manifestDir, '*.json')):
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+            except ValueError:
+                os.remove(path)
+                continue
+            manifests.append((manifest['time'], manifest['name'], [entry['hash'] for entry in manifest['files'].itervalues()], os.path.getsize(path)))
+        for (started, name, hashes, size) in sorted(manifests):
+            self.manifests[name] = (hashes, size)
+            self.total += size
+            for digest in hashes:
+                self.refs[digest] = self.refs.get(digest, 0) + 1
+        for path in glob.glob(os.path.join(self.blobDir, '*', '*')):
+            digest = os.path.basename(os.path.dirname(path)) + os.path.basename(path)[:-len('.gz')]
+            if not path.endswith('.gz') or digest not in self.refs:
+                os.remove(path)
+                continue
+            self.sizes[digest] = os.path.getsize(path)
+            self.total += self.sizes[digest]
+        self.trim()
+
+    def store(self, path):
+        ''' Store a file (unless we have it already), and count a reference to it. Return its hash. '''
+        digest = fileHash(path)
+        with self.lock:
+            # Our reference keeps it from being evicted until our manifest is written.
+            self.refs[digest] = self.refs.get(digest, 0) + 1
+            if digest in self.sizes:
+                self.deduplicated += 1
+                return digest
+        blob = self.blobPath(digest)
+        makeDirectory(os.path.dirname(blob))
+        tmp = '%s.%d.%d.tmp' % (blob, os.getpid(), threading.current_thread().ident)
+        with open(path, 'rb') as source:
+            compressed = gzip.open(tmp, 'wb')
+            try:
+                shutil.copyfileobj(source, compressed, chunkSize)
+            finally:
+                compressed.close()
+        with self.lock:
+            if digest in self.sizes:
+                # Someone else stored it while we were.
+                os.remove(tmp)
+            else:
+                os.rename(tmp, blob)
+                self.sizes[digest] = os.path.getsize(blob)
+                self.total += self.sizes[digest]
+        return digest
+
+    def add(self, name, directory, patterns, extras = None, info = None):
+        ''' Archive (as name) the files in directory matching any of patterns (a directory is archived whole),
+        and extras, a map of names to paths. info (a dict) is saved in the manifest. Return the manifest's path.
+        '''
+        paths = []
+        for pattern in patterns:
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                if os.path.isdir(path) and not os.path.islink(path):
+                    for (dirpath, dirnames, filenames) in os.walk(path):
+                        dirnames.sort()
+                        paths.extend([os.path.join(dirpath, f) for f in sorted(filenames)])
+                else:
+                    paths.append(path)
+        entries = [(os.path.relpath(path, directory), path) for path in paths]
+        if extras is not None:
+            entries.extend(sorted(extras.items()))
+        files = collections.OrderedDict()
+        for (relative, path) in entries:
+            if relative in files or not os.path.isfile(path):
+                continue
+            s = os.stat(path)
+            files[relative] = { 'hash' : self.store(path), 'size' : s.st_size, 'mode' : s.st_mode & 0777 }
+        manifest = { 'name' : name, 'time' : time.time(), 'info' : info if info is not None else {}, 'files' : files }
+        path = self.manifestPath(name)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        with self.lock:
+            os.rename(tmp, path)
+            # A seed archived again replaces its earlier manifest.
+            if name in self.manifests:
+                self.remove(name)
+            self.manifests[name] = ([entry['hash'] for entry in files.itervalues()], os.path.getsize(path))
+            self.total += self.manifests[name][1]
+            self.added += 1
+            self.trim()
+        if self.verbose > 0:
+            print >>sys.stderr, 'failureArchive.add: %s, %d files, %d bytes' % (name, len(files), sum([entry['size'] for entry in files.itervalues()]))
+        return path
+
+    def remove(self, name):
+        ''' Forget a seed, and remove the files no other seed needs. (We hold our lock.) '''
+        (hashes, size) = self.manifests.pop(name)
+        self.total -= size
+        for digest in hashes:
+            self.refs[digest] -= 1
+            if self.refs[digest] == 0:
+                del self.refs[digest]
+                if digest in self.sizes:
+                    os.remove(self.blobPath(digest))
+                    self.total -= self.sizes.pop(digest)
+
+    def trim(self):
+        ''' Remove the oldest seeds until we're under our limit (but keep the newest). (We hold our lock.) '''
+        while self.total > self.maxBytes and len(self.manifests) > 1:
+            name = next(self.manifests.iterkeys())
+            path = self.manifestPath(name)
+            if os.path.exists(path):
+                os.remove(path)
+            self.remove(name)
+            self.evicted += 1
+
+    def report(self):
+        with self.lock:
+            return 'failureArchive: %d seeds, %d files in %.1f MB, %d files stored once for several seeds, %d seeds removed to make room' \
+                % (len(self.manifests), len(self.sizes), self.total / 1048576.0, self.deduplicated, self.evicted)
+
+def extract(root, name, directory):
+    ''' Restore the files of the seed archived (in the archive at root) as name, in directory. '''
+    archive = os.path.abspath(root)
+    with open(os.path.join(archive, 'seeds', unsafeRE.sub('_', name) + '.json'), 'r') as f:
+        manifest = json.load(f)
+    for (relative, entry) in manifest['files'].iteritems():
+        path = os.path.join(directory, relative)
+        makeDirectory(os.path.dirname(os.path.abspath(path)))
+        digest = entry['hash']
+        compressed = gzip.open(os.path.join(archive, 'blobs', digest[:2], digest[2:] + '.gz'), 'rb')
+        try:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(compressed, f, chunkSize)
+        finally:
+            compressed.close()
+        os.chmod(path, entry['mode'])
+    return manifest
+
+def main(argv=None):
+    ''' List or extract the seeds in a failure archive. '''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = ArgumentParser(description='List, or extract the artifacts of, the seeds in a citSupport failure archive.')
+    parser.add_argument('archive', help='the archive (written by citSupport --archive)')
+    parser.add_argument('seed', help='the seed to extract (otherwise list them)', nargs='?', default=None)
+    parser.add_argument('-o', '--output', dest='output', help='directory in which to extract the seed\'s files [default: test.<seed>]', default=None)
+    args = parser.parse_args(argv)
+    if not os.path.isdir(os.path.join(args.archive, 'seeds')):
+        print >>sys.stderr, 'failureArchive: %s isn\'t an archive' % (args.archive)
+        return 1
+    if args.seed is None:
+        manifests = []
+        for path in glob.glob(os.path.join(args.archive, 'seeds', '*.json')):
+            with open(path, 'r') as f:
+                manifests.append(json.load(f))
+        for manifest in sorted(manifests, key=lambda m: m['time']):
+            print '\t'.join([manifest['name'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['time'])),
+                             str(manifest['info'].get('signature')), '%d files' % (len(manifest['files'])),
+                             '%d bytes' % (sum([entry['size'] for entry in manifest['files'].itervalues()]))])
+        return 0
+    output = args.output if args.output is not None else 'test.%s' % (unsafeRE.sub('_', args.seed))
+    try:
+        manifest = extract(args.archive, args.seed, output)
+    except IOError as e:
+        print >>sys.stderr, 'failureArchive: can\'t extract %s: %s' % (args.seed, e)
+        return 1
+    print 'failureArchive: %d files of seed "%s" extracted in %s' % (len(manifest['files']), args.seed, output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import hashlib
+import re
+import threading
+
+# Things in error messages which differ between seeds failing the same way.
+addressRE = re.compile(r'(0x[0-9a-fA-F]+|@[0-9a-fA-F]{4,})')
+numberRE = re.compile(r'\d+')
+spaceRE = re.compile(r'\s+')
+
+def normalize(line, variables):
+    ''' Remove the seed specific parts of line. '''
+    for name in ['testDir', 'seed']:
+        value = variables.get(name)
+        if value:
+            line = line.replace(value, '$(%s)' % (name))
+    line = addressRE.sub('ADDR', line)
+    line = numberRE.sub('N', line)
+    return spaceRE.sub(' ', line).strip()
+
+def fingerprint(records, result, stderrTail, variables):
+    ''' Return the signature of a failure: the index of the failing command,
+    its exit code (or signal), and a hash of the (normalized) end of its stderr.
+    '''
+    index = records[-1]['index'] if len(records) > 0 else -1
+    h = hashlib.sha1()
+    for line in stderrTail:
+        h.update(normalize(line, variables) + '\n')
+    return '%d:%d:%s' % (index, result, h.hexdigest()[:12])
+
+class bucket():
+    def __init__(self, signature):
+        self.signature = signature
+        self.count = 0
+        self.exemplars = []
+
+class failureBuckets():
+    ''' Group failing seeds by the signatures of their failures,
+    remembering the first few seeds (the exemplars) in each bucket.
+    '''
+
+    def __init__(self, exemplars = 1):
+        self.exemplars = exemplars
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, signature, seed):
+        ''' Add a failing seed to its bucket.
+        Return True if it's one of the bucket's exemplars (whose artifacts should be kept).
+        '''
+        with self.lock:
+            b = self.buckets.get(signature)
+            if b is None:
+                b = bucket(signature)
+                self.buckets[signature] = b
+            b.count += 1
+            if len(b.exemplars) < self.exemplars:
+                b.exemplars.append(seed)
+                return True
+            return False
+
+    def report(self):
+        ''' Return a (printable) summary of the buckets, largest first. '''
+        with self.lock:
+            buckets = sorted(self.buckets.values(), key=lambda b: -b.count)
+            lines = ['%d failures in %d buckets' % (sum([b.count for b in buckets]), len(buckets))]
+            for b in buckets:
+                lines.append('%-24s %8d  %s' % (b.signature, b.count, ' '.join(b.exemplars)))
+        return '\n'.join(lines)
@@ -0,0 +1,254 @@
+'''
+Created on Oct 18, 2026
+'''
+import errno
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from testRun import shellCharsRE
+
+# The server lives in (and runs commands in) the test directory it serves,
+# since a JVM can't change its working directory and the tests write their
+# output (Torture.vcd, etc.) relative to it.
+serverDirName = '.citserver'
+startTimeout = 120
+stopTimeout = 5
+
+serverSource = '''package citserver
+
+import java.io.{BufferedReader, File, InputStreamReader, OutputStreamWriter, PrintWriter}
+import java.lang.reflect.InvocationTargetException
+import java.net.{InetAddress, ServerSocket, URLClassLoader}
+import java.nio.file.Files
+import java.security.Permission
+
+class ExitTrapped(val status: Int) extends SecurityException("exit " + status)
+
+object CitServer {
+  @volatile var exiting = false
+
+  def compile(args: Array[String]): Int = synchronized {
+    if (scala.tools.nsc.Main.process(args)) 0 else 1
+  }
+
+  def run(classPath: String, className: String, args: Array[String]): Int = {
+    // Load the test classes in a fresh loader each time, so recompiled classes are seen,
+    // but delegate to ours so the (unchanging) classpath jars stay loaded and warm.
+    val urls = classPath.split(File.pathSeparator).filter(_.nonEmpty).map(new File(_).getAbsoluteFile.toURI.toURL)
+    val loader = new URLClassLoader(urls, getClass.getClassLoader)
+    try {
+      loader.loadClass(className).getMethod("main", classOf[Array[String]]).invoke(null, args)
+      0
+    } catch {
+      case e: InvocationTargetException => e.getCause match {
+        case x: ExitTrapped => x.status
+        case t => t.printStackTrace(); 1
+      }
+      case x: ExitTrapped => x.status
+      case t: Throwable => t.printStackTrace(); 1
+    } finally {
+      loader.close()
+    }
+  }
+
+  def main(args: Array[String]): Unit = {
+    System.setSecurityManager(new SecurityManager {
+      override def checkExit(status: Int): Unit = if (!exiting) throw new ExitTrapped(status)
+      override def checkPermission(perm: Permission): Unit = {}
+    })
+    val server = new ServerSocket(0, 1, InetAddress.getLoopbackAddress)
+    val tmp = new File(args(0) + ".tmp")
+    Files.write(tmp.toPath, server.getLocalPort.toString.getBytes)
+    tmp.renameTo(new File(args(0)))
+    while (true) {
+      val socket = server.accept()
+      val in = new BufferedReader(new InputStreamReader(socket.getInputStream, "UTF-8"))
+      val out = new PrintWriter(new OutputStreamWriter(socket.getOutputStream, "UTF-8"), true)
+      val request = in.readLine()
+      val fields = if (request == null) Array[String]() else request.split("\\t", -1)
+      val status = fields.headOption match {
+        case Some("compile") => compile(fields.drop(1))
+        case Some("run") if fields.length >= 3 => run(fields(1), fields(2), fields.drop(3))
+        case Some("shutdown") =>
+          exiting = true
+          out.println("exit 0")
+          socket.close()
+          sys.exit(0)
+        case _ => 2
+      }
+      out.println("exit " + status)
+      socket.close()
+    }
+  }
+}
+'''
+
+class jvmServer():
+    ''' Start and supervise a long-lived JVM to compile and run scala code
+    on behalf of testRun, so each scalac/scala command doesn't pay for
+    JVM startup and classpath loading.
+    Commands it can't handle (or any command when the server can't be
+    (re)started) are left for the caller to run normally.
+    '''
+
+    def __init__(self, classPath, directory, verbose = 0, maxRestarts = 3):
+        self.classPath = classPath
+        self.directory = directory
+        self.verbose = verbose
+        self.maxRestarts = maxRestarts
+        self.serverDir = os.path.join(directory, serverDirName)
+        self.portFile = os.path.join(self.serverDir, 'port')
+        self.process = None
+        self.port = None
+        self.starts = 0
+        self.aborted = False
+        self.interrupted = False
+
+    def request(self, command):
+        ''' Return the server request for command, or None if it isn't something we handle. '''
+        if shellCharsRE.search(command):
+            return None
+        argv = shlex.split(command)
+        if len(argv) == 0:
+            return None
+        if argv[0] == 'scalac':
+            return ['compile'] + argv[1:]
+        elif argv[0] == 'scala':
+            classPath = '.'
+            i = 1
+            while i < len(argv) and argv[i].startswith('-'):
+                if argv[i] in ['-classpath', '-cp'] and i + 1 < len(argv):
+                    classPath = argv[i + 1]
+                    i += 2
+                else:
+                    # Some option we don't understand.
+                    return None
+            if i >= len(argv):
+                return None
+            return ['run', classPath, argv[i]] + argv[i + 1:]
+        return None
+
+    def isRunning(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        ''' Compile (if necessary) and start the server, and wait for it to tell us its port. '''
+        modName = 'jvmServer.start'
+        if self.starts > self.maxRestarts:
+            return False
+        self.starts += 1
+        try:
+            os.mkdir(self.serverDir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                print >>sys.stderr, "%s: os.mkdir(%s) returns %d: %s" % (modName, e.filename, e.errno, e.strerror)
+                return False
+
+        FNULL = open(os.devnull, 'r')
+        try:
+            if not os.path.exists(os.path.join(self.serverDir, 'citserver')):
+                source = os.path.join(self.serverDir, 'CitServer.scala')
+                with open(source, 'w') as f:
+                    f.write(serverSource)
+                retcode = subprocess.call(['scalac', '-classpath', self.classPath, '-d', self.serverDir, source],
+                                          stdin=FNULL, close_fds=True, cwd=self.directory)
+                if retcode != 0:
+                    print >>sys.stderr, '%s: can\'t compile %s: %d' % (modName, source, retcode)
+                    return False
+
+            if os.path.exists(self.portFile):
+                os.remove(self.portFile)
+            self.process = subprocess.Popen(['scala', '-classpath', '%s:%s' % (self.classPath, self.serverDir),
+                                             'citserver.CitServer', self.portFile],
+                                            stdin=FNULL, close_fds=True, cwd=self.directory)
+        finally:
+            FNULL.close()
+
+        deadline = time.time() + startTimeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                print >>sys.stderr, '%s: server exited with %d' % (modName, self.process.returncode)
+                self.process = None
+                return False
+            if os.path.exists(self.portFile):
+                with open(self.portFile, 'r') as f:
+                    self.port = int(f.read())
+                if self.verbose > 0:
+                    print >>sys.stderr, '%s: server for %s listening on %d' % (modName, self.directory, self.port)
+                return True
+            time.sleep(0.1)
+        print >>sys.stderr, '%s: server didn\'t start in %d seconds' % (modName, startTimeout)
+        self.kill()
+        return False
+
+    def send(self, request):
+        ''' Send a request to the server and return its exit status. '''
+        s = socket.create_connection(('127.0.0.1', self.port))
+        try:
+            s.sendall('\t'.join(request) + '\n')
+            reply = s.makefile('r').readline()
+        finally:
+            s.close()
+        (word, sep, status) = reply.strip().partition(' ')
+        if word != 'exit':
+            raise ValueError('unexpected reply "%s"' % (reply.strip()))
+        return int(status)
+
+    def run(self, command):
+        ''' Run command in the server and return its exit status,
+        or None if the caller should run it instead.
+        '''
+        modName = 'jvmServer.run'
+        request = self.request(command)
+        if request is None:
+            return None
+        self.interrupted = False
+        # If the server has died, restart it and try again.
+        for _ in range(2):
+            if self.aborted:
+                return None
+            if not self.isRunning() and not self.start():
+                return None
+            try:
+                return self.send(request)
+            except (socket.error, ValueError) as e:
+                # If we killed it, don't try again.
+                if self.interrupted:
+                    return -signal.SIGKILL
+                print >>sys.stderr, '%s: "%s" failed: %s' % (modName, command, e)
+                self.kill()
+        return None
+
+    def kill(self):
+        process = self.process
+        self.process = None
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def interrupt(self):
+        ''' Kill the server (and the command it's running). It'll be restarted for the next command. '''
+        self.interrupted = True
+        self.kill()
+
+    def abort(self):
+        ''' Kill the server (and whatever it's running) and don't restart it. '''
+        self.aborted = True
+        self.kill()
+
+    def stop(self):
+        ''' Ask the server to exit, killing it if it won't. '''
+        if self.isRunning():
+            try:
+                self.send(['shutdown'])
+            except (socket.error, ValueError):
+                pass
+            deadline = time.time() + stopTimeout
+            while self.process.poll() is None and time.time() < deadline:
+                time.sleep(0.1)
+        self.kill()
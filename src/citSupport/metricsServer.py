@@ -0,0 +1,80 @@
+'''
+Created on Oct 18, 2026
+'''
+import BaseHTTPServer
+import SocketServer
+import sys
+import threading
+
+contentType = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape(value):
+    ''' Escape a label value for the Prometheus text format. '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def sample(name, value, labels = None):
+    ''' Return one line of the Prometheus text format. labels is a list of (name, value) pairs. '''
+    if labels:
+        name = '%s{%s}' % (name, ','.join(['%s="%s"' % (label, escape(v)) for (label, v) in labels]))
+    return '%s %s' % (name, repr(float(value)) if isinstance(value, float) else value)
+
+def metric(name, kind, help, samples):
+    ''' Return the lines describing a metric (kind is counter, gauge or histogram) and its samples. '''
+    return ['# HELP %s %s' % (name, help), '# TYPE %s %s' % (name, kind)] + samples
+
+class metricsHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class metricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    ''' Answer GET /metrics with whatever our server's collect() returns. '''
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+            self.end_headers()
+            self.wfile.write('try /metrics\n')
+            return
+        try:
+            body = '\n'.join(self.server.metrics.collect()) + '\n'
+        except Exception as e:
+            print >>sys.stderr, 'metricsServer: %s' % (e)
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.metrics.verbose > 1:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class metricsServer():
+    ''' Serve metrics (in the Prometheus text format) over HTTP, from a thread of our own.
+    collect is called for each request, and returns a list of lines (see metric()).
+    Nothing is computed until someone asks, so we cost the hot loop nothing between scrapes.
+    '''
+
+    def __init__(self, collect, port, address = '', verbose = 0):
+        self.collect = collect
+        self.verbose = verbose
+        self.server = metricsHTTPServer((address, port), metricsHandler)
+        self.server.metrics = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metricsServer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.thread = None
@@ -4,22 +4,129 @@ Created on Jul 3, 2014
 @author: jrl
 '''
 import os
+import Queue
+import threading
+import time
 from urlparse import urlparse
-from git import Repo
+from git import Repo, GitCommandError
 from github3 import login, GitHubError
 from datetime import datetime, timedelta
+from requests.exceptions import RequestException
 from ugError import Error
+from webhookReceiver import webhookReceiver
 
+# Where we find the GitHub API. This may be overridden (with GHAPIURL) to point at a stand-in server.
+defaultApiUrl = os.environ.get('GHAPIURL', 'https://api.github.com')
+gitHubTimeFormat = '%Y-%m-%dT%H:%M:%SZ'
+# However short the period, the poller waits at least this long between polls.
+minPollSeconds = 1.0
+
+# The ETag and body of the last response for each URL we've polled,
+# so polling an unchanged resource costs a 304 (which isn't counted against our rate limit).
+responseCache = {}
+responseCacheLock = threading.Lock()
 
 def fail(s):
     raise Error(s)
 
+def gitHubLogin():
+    ''' Login to GitHub, returning a session which may be shared by all our repos. '''
+    if 'GHRPAT' not in os.environ:
+        fail('envrionment variable GHRPAT is not set')
+    token = os.environ['GHRPAT']
+    try:
+        gh = login(token=token)
+    except GitHubError as e:
+        fail('can\'t connect/authenticate to GitHub: %s' % (e.msg))
+    if not gh:
+        fail('can\'t connect/authenticate to GitHub')
+    return gh
+
+def forEach(function, items, maxWorkers):
+    ''' Call function on each of items, using up to maxWorkers threads. '''
+    queue = Queue.Queue()
+    for item in items:
+        queue.put(item)
+
+    def work():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            function(item)
+
+    threads = [threading.Thread(target=work) for _ in range(min(maxWorkers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class rateLimit():
+    ''' Keep track of our GitHub API rate limit, from the headers of its responses. '''
+
+    def __init__(self):
+        self.remaining = None
+        self.reset = None
+        self.lock = threading.Lock()
+
+    def update(self, headers):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is not None and reset is not None:
+            with self.lock:
+                self.remaining = int(remaining)
+                self.reset = int(reset)
+
+    def interval(self, polls, period):
+        ''' Return the number of seconds between polls, to spread polls evenly over period,
+        but no closer than our remaining requests allow before the limit is reset (or than minPollSeconds).
+        '''
+        interval = max(period / max(polls, 1), minPollSeconds)
+        with self.lock:
+            if self.remaining is not None:
+                window = self.reset - time.time()
+                if window > 0:
+                    interval = max(interval, window / max(self.remaining, 1))
+        return interval
+
+rateLimits = rateLimit()
+
+def conditionalGet(session, url):
+    ''' GET url, using a conditional request if we've seen it before.
+    Return the (possibly cached) decoded JSON body, and whether it changed.
+    '''
+    headers = {}
+    with responseCacheLock:
+        cached = responseCache.get(url)
+    if cached is not None:
+        headers['If-None-Match'] = cached[0]
+    try:
+        response = session.get(url, headers=headers)
+    except RequestException as e:
+        fail('can\'t get %s: %s' % (url, e))
+    rateLimits.update(response.headers)
+    if response.status_code == 304 and cached is not None:
+        return (cached[1], False)
+    if response.status_code != 200:
+        fail('can\'t get %s: %d %s' % (url, response.status_code, response.reason))
+    body = response.json()
+    etag = response.headers.get('ETag')
+    if etag is not None:
+        with responseCacheLock:
+            responseCache[url] = (etag, body)
+    return (body, True)
+
+def unexpectedError(repo, e):
+    ''' Describe an exception (other than our Error) from polling repo. '''
+    return 'can\'t refresh %s/%s:%s: %s: %s' % (repo.remoteowner, repo.remotereponame, repo.trackingbranch, type(e).__name__, e)
+
 class BaseRepo():
     ''' Connect to a specified git repository and
     provide notification if/when its content is updated.
     '''
 
-    def __init__(self, path):
+    def __init__(self, path, apiUrl = defaultApiUrl):
         (gitrepo,sep, branch) = path.rpartition(':')
         if sep == "":
             gitrepo = branch
@@ -55,6 +162,13 @@ class BaseRepo():
         self.connected = False
         self.gh = None
         self.auth = None
+        self.apiUrl = apiUrl
+        self.session = None
+        self.pushedhead = None
+        self.pusheddatetime = None
+        # When we last asked the remote for its head (as a time.time()), and what went wrong if we couldn't.
+        self.lastPoll = None
+        self.pollError = None
         # Can we parse the remote URL?
         if remoteUrl.startswith('git@'):
             remoteUrl = remoteUrl.replace(':', '/', 1).replace('@', '://', 1)
@@ -74,49 +188,58 @@ class BaseRepo():
         else:
             fail('can\'t parse url "%s"' % (repo.remotes.origin.url))
 
-    def connect(self):
-        ''' Connect to the remote repository.'''
-        if 'GHRPAT' not in os.environ:
-            fail('envrionment variable GHRPAT is not set')
-        token = os.environ['GHRPAT']
-
+    def connect(self, gh = None):
+        ''' Connect to the remote repository.
+        If we're given a GitHub session (from gitHubLogin()), share it.
+        This makes no request: our polls are the only requests we make, and they go to apiUrl.
+        '''
         # Strip any trailing '.git' off the name of the repo
         reponame = self.remotereponame
         if reponame.endswith('.git'):
             reponame = reponame[:-4]
- 
-        gh = None
-        try:
-            gh = login(token=token)
-            if gh:
-                self.gh = gh
-                self.remoterepo = gh.repository(self.remoteowner, reponame)
-                self.connected = True
-            else:
-                fail('can\'t connect/authenticate to remote repo: %s/%s'
-                     % (self.remoteowner, reponame))
-        except GitHubError as e:
-            fail('can\'t connect/authenticate to remote repo: %s/%s: %s'
-                % (self.remoteowner, reponame, e.msg))
+        self.reponame = reponame
+
+        if gh is None:
+            gh = gitHubLogin()
+        self.gh = gh
+        self.session = gh.session
+        self.connected = True
         return gh
 
-    def getLastPushed(self):
+    def getLastPushed(self, since = None):
+        ''' Find the head most recently pushed to our tracking branch.
+        We look at this repository's events, and if there's no recent
+        PushEvent for our branch, at the branch itself. Both are
+        conditional requests, so an unchanged repository is cheap to poll
+        (and we always ask: since is for GitRepo's sake).
+        '''
+        if self.session is None:
+            fail('not connected to remote repo: %s/%s' % (self.remoteowner, self.remotereponame))
+
         # Generate a string to facilitate branch reference comparisons
         refMatch = "refs/heads/" + self.trackingbranch
 
         # Pick up he most recent PushEvent (fortunately, events are ordered
         # in increasing age, i.e., newest first)
-        pushevent = None
-        for e in self.gh.all_events():
-            if e.type == 'PushEvent':
+        url = '%s/repos/%s/%s/events' % (self.apiUrl, self.remoteowner, self.reponame)
+        (events, changed) = conditionalGet(self.session, url)
+        if not changed and self.pushedhead is not None:
+            return
+        for e in events:
+            if e['type'] == 'PushEvent':
                 # Does this refer to our tracking branch?
-                if e.payload['ref'] == refMatch:
-                    pushevent = e
-                    break
-        if pushevent is None:
-            fail('can\'t find any PushEvents for %s' % (refMatch))
-        self.pusheddatetime = pushevent.created_at
-        self.pushedhead = pushevent.payload['head']
+                if e['payload']['ref'] == refMatch:
+                    self.pusheddatetime = datetime.strptime(e['created_at'], gitHubTimeFormat)
+                    self.pushedhead = e['payload']['head']
+                    return
+
+        # Our last push has scrolled out of the events; ask for the branch.
+        url = '%s/repos/%s/%s/branches/%s' % (self.apiUrl, self.remoteowner, self.reponame, self.trackingbranch)
+        (branch, changed) = conditionalGet(self.session, url)
+        if 'commit' not in branch:
+            fail('can\'t find the head of %s' % (refMatch))
+        self.pusheddatetime = datetime.strptime(branch['commit']['commit']['committer']['date'], gitHubTimeFormat)
+        self.pushedhead = branch['commit']['sha']
 
     def disconnect(self):
         ''' Disconnect from the remote repository.'''
@@ -125,23 +248,186 @@ class BaseRepo():
     def isChanged(self):
         return 0 if self.pushedhead == self.localhead.hexsha else 1
 
+# The heads of the branches we track on each git remote,
+# and when we (last) started asking the remote for them.
+trackedBranches = {}
+remoteHeads = {}
+remoteHeadsLock = threading.Lock()
+# Held while we ask each remote, so the repos refreshed together wait for one answer.
+remoteLocks = {}
+
+def lsRemote(repo, url, since = None):
+    ''' Return a map of each branch we track on the remote at url to its head.
+    We ask the remote (for all the branches at once) unless we've asked it since since (a time.time()),
+    so the repos of a refresh can share one ls-remote. Without since, we always ask.
+    '''
+    if since is None:
+        since = time.time()
+    with remoteHeadsLock:
+        lock = remoteLocks.setdefault(url, threading.Lock())
+    with lock:
+        with remoteHeadsLock:
+            cached = remoteHeads.get(url)
+            if cached is not None and cached[0] >= since:
+                return cached[1]
+            refs = ['refs/heads/' + branch for branch in sorted(trackedBranches[url])]
+        asked = time.time()
+        try:
+            output = repo.git.ls_remote(url, *refs)
+        except GitCommandError as e:
+            fail('can\'t ls-remote %s: %s' % (url, e))
+        heads = {}
+        for line in output.splitlines():
+            (sha, sep, ref) = line.partition('\t')
+            if ref.startswith('refs/heads/'):
+                heads[ref[len('refs/heads/'):]] = sha
+        with remoteHeadsLock:
+            remoteHeads[url] = (asked, heads)
+    return heads
+
+class GitRepo():
+    ''' Monitor a local clone's remote with git itself (ls-remote), rather than the GitHub API.
+    This works with any remote git can reach (file://, ssh, mirrors), with no token or rate limit.
+    '''
+
+    def __init__(self, path):
+        (gitrepo,sep, branch) = path.rpartition(':')
+        if sep == "":
+            gitrepo = branch
+            branch = ""
+        repo = Repo(gitrepo)
+        self.localhead = repo.head.commit
+        # If a specific branch name is supplied, use it.
+        if branch == "":
+            # Otherwise, use the current head.
+            branch = repo.head.ref.name
+        self.branch = branch
+        trackingbranch = repo.heads[branch].tracking_branch()
+        if trackingbranch:
+            self.trackingbranch = trackingbranch.remote_head
+        else:
+            fail('no tracking branch for %s:%s' % (gitrepo, self.branch))
+        self.remoteurl = repo.remotes[trackingbranch.remote_name].url
+        self.repo = repo
+
+        # For matching webhooks, if this happens to be a GitHub remote (or a mirror of one).
+        components = self.remoteurl.replace(':', '/').rstrip('/').split('/')
+        self.remoteowner = components[-2] if len(components) > 1 else ''
+        self.remotereponame = components[-1]
+
+        self.connected = False
+        self.pushedhead = None
+        self.pusheddatetime = None
+        # When we last asked the remote for its head (as a time.time()), and what went wrong if we couldn't.
+        self.lastPoll = None
+        self.pollError = None
+        with remoteHeadsLock:
+            trackedBranches.setdefault(self.remoteurl, set()).add(self.trackingbranch)
+
+    def connect(self, gh = None):
+        ''' There's no connection to make, but make sure we can reach the remote. '''
+        lsRemote(self.repo, self.remoteurl, 0)
+        self.connected = True
+
+    def getLastPushed(self, since = None):
+        ''' Find our branch's head on the remote, asking it afresh unless it's been asked since since. '''
+        heads = lsRemote(self.repo, self.remoteurl, since)
+        if self.trackingbranch not in heads:
+            fail('can\'t find %s on %s' % (self.trackingbranch, self.remoteurl))
+        if heads[self.trackingbranch] != self.pushedhead:
+            self.pushedhead = heads[self.trackingbranch]
+            self.pusheddatetime = datetime.now()
+
+    def disconnect(self):
+        self.connected = False
+
+    def isChanged(self):
+        return 0 if self.pushedhead == self.localhead.hexsha else 1
+
+def newRepo(path, backend):
+    ''' Return a repo to monitor path, which may end with #github or #git to choose its backend. '''
+    (path, sep, suffix) = path.partition('#')
+    if sep != '':
+        backend = suffix
+    if backend == 'github':
+        return BaseRepo(path)
+    elif backend == 'git':
+        return GitRepo(path)
+    fail('unknown backend "%s" for %s' % (backend, path))
+
 class MonitorRepos():
     ''' Maintain a connection to github hosted repositories, monitoring them for pushes.'''
 
-    def __init__(self, repoPaths, period = timedelta(minutes = 15)):
-        ''' Verify we can contact the remote origins of the specified repositories.'''
+    def __init__(self, repoPaths, period = timedelta(minutes = 15), maxWorkers = 8, backend = 'github'):
+        ''' Verify we can contact the remote origins of the specified repositories.
+        Each path is monitored using backend, unless it ends with #github or #git.
+        '''
         repoMap = {}
         for path in repoPaths:
             try:
-                repo = BaseRepo(path)
-                repoMap[path] = repo
-                repo.connect()
-                repo.getLastPushed()
+                repoMap[path] = newRepo(path, backend)
+            except Error as e:
+                print e.msg
+        self.maxWorkers = maxWorkers
+
+        # Share one session between all our GitHub repos, and connect them concurrently.
+        gh = None
+        if len([repo for repo in repoMap.values() if isinstance(repo, BaseRepo)]) > 0:
+            try:
+                gh = gitHubLogin()
+            except Error as e:
+                print e.msg
+
+        def connect(repo):
+            if isinstance(repo, BaseRepo) and gh is None:
+                return
+            try:
+                repo.connect(gh)
+                repo.getLastPushed(started)
+                repo.pollError = None
             except Error as e:
+                repo.pollError = e.msg
                 print e.msg
+            except Exception as e:
+                repo.pollError = unexpectedError(repo, e)
+                print repo.pollError
+            repo.lastPoll = time.time()
+
+        started = time.time()
+        forEach(connect, repoMap.values(), maxWorkers)
         self.repoMap = repoMap
         self.period = period
         self.lastcheck = datetime.now() - period
+        # Set by the background poller (or webhook receiver) when it sees a change.
+        self.changed = threading.Event()
+        self.changedRepos = set()
+        self.changedLock = threading.Lock()
+        self.stopPolling = threading.Event()
+        self.poller = None
+        self.receiver = None
+        self.onChange = None
+
+    def refreshRepo(self, repo, since = None):
+        ''' Update the last pushed head of one of our repositories
+        (from what its remote told us since since, if we're refreshing several at once).
+        '''
+        if repo.connected:
+            try:
+                repo.getLastPushed(since)
+                repo.pollError = None
+            except Error as e:
+                repo.pollError = e.msg
+                print e.msg
+            except Exception as e:
+                # A response we didn't expect (not JSON, or missing a field) mustn't stop the poller.
+                repo.pollError = unexpectedError(repo, e)
+                print repo.pollError
+            repo.lastPoll = time.time()
+
+    def refresh(self):
+        ''' Update the last pushed head of each of our repositories. '''
+        since = time.time()
+        forEach(lambda repo: self.refreshRepo(repo, since), self.repoMap.values(), self.maxWorkers)
 
     def checkRepos(self):
         ''' Return an array of repositories with updated content. '''
@@ -151,8 +437,66 @@ class MonitorRepos():
                 reposToFetch.append(name)
         return reposToFetch
 
+    def poll(self):
+        ''' Refresh our repositories one at a time, spread over our period
+        (or further apart if we're running short of requests), until told to stop.
+        '''
+        names = sorted(self.repoMap.keys())
+        polls = 0
+        while not self.stopPolling.wait(rateLimits.interval(len(names), self.period.total_seconds())):
+            if len(names) == 0:
+                continue
+            self.refreshRepo(self.repoMap[names[polls % len(names)]])
+            polls += 1
+            self.lastcheck = datetime.now()
+            self.noteChanges(self.checkRepos())
+
+    def noteChanges(self, names):
+        ''' Remember that these repositories have changed, and tell whoever's interested. '''
+        if len(names) == 0:
+            return
+        with self.changedLock:
+            self.changedRepos.update(names)
+        self.changed.set()
+        if self.onChange is not None:
+            self.onChange()
+
+    def listen(self, port, secret, verbose = 0):
+        ''' Accept push webhooks on port, so we hear about changes as soon as they're pushed. '''
+        self.receiver = webhookReceiver(self, secret, port, verbose=verbose)
+        self.receiver.start()
+
+    def start(self, onChange = None):
+        ''' Start polling our repositories in the background.
+        onChange (if supplied) is called (from the poller's or webhook receiver's thread)
+        when one of them changes.
+        '''
+        self.onChange = onChange
+        if self.changed.is_set() and onChange is not None:
+            onChange()
+        self.stopPolling.clear()
+        self.poller = threading.Thread(target=self.poll, name='MonitorRepos.poll')
+        self.poller.daemon = True
+        self.poller.start()
+
+    def stop(self):
+        if self.poller is not None:
+            self.stopPolling.set()
+            self.poller.join()
+            self.poller = None
+        if self.receiver is not None:
+            self.receiver.stop()
+            self.receiver = None
+
     def reposChangedSince(self, period = None):
         reposToFetch = []
+        # If we're polling in the background, or being told about pushes, we know already.
+        if self.poller is not None or self.receiver is not None:
+            if self.changed.is_set():
+                with self.changedLock:
+                    reposToFetch = sorted(self.changedRepos)
+            return reposToFetch
+
         if period is None:
             period = self.period
 
@@ -160,6 +504,7 @@ class MonitorRepos():
         checkedWhen = datetime.now()
         if checkedWhen > (self.lastcheck + period):
             # See if we have new content
+            self.refresh()
             reposToFetch = self.checkRepos()
             self.lastcheck = checkedWhen
         return reposToFetch
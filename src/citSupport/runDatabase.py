@@ -0,0 +1,259 @@
+'''
+Created on Oct 18, 2026
+'''
+from argparse import ArgumentParser
+import collections
+import os
+import Queue
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL,
+    finished REAL,
+    host TEXT,
+    seeds INTEGER DEFAULT 0,
+    failures INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS heads (
+    run INTEGER REFERENCES runs(id),
+    repo TEXT,
+    sha TEXT
+);
+CREATE TABLE IF NOT EXISTS seeds (
+    id INTEGER PRIMARY KEY,
+    run INTEGER REFERENCES runs(id),
+    seed TEXT,
+    time REAL,
+    result INTEGER,
+    timedout INTEGER,
+    wall REAL,
+    bucket TEXT,
+    skipped INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS commands (
+    seed INTEGER REFERENCES seeds(id),
+    idx INTEGER,
+    step TEXT,
+    command TEXT,
+    how TEXT,
+    retcode INTEGER,
+    wall REAL,
+    user REAL,
+    sys REAL,
+    maxrss INTEGER
+);
+CREATE INDEX IF NOT EXISTS heads_sha ON heads(sha);
+CREATE INDEX IF NOT EXISTS heads_run ON heads(run);
+CREATE INDEX IF NOT EXISTS seeds_seed ON seeds(seed);
+CREATE INDEX IF NOT EXISTS seeds_run ON seeds(run);
+CREATE INDEX IF NOT EXISTS seeds_time ON seeds(time);
+CREATE INDEX IF NOT EXISTS seeds_bucket ON seeds(bucket);
+CREATE INDEX IF NOT EXISTS commands_seed ON commands(seed);
+CREATE INDEX IF NOT EXISTS commands_step ON commands(step);
+'''
+
+# How long the writer lets results accumulate before committing them.
+commitSeconds = 2.0
+
+def upgrade(connection):
+    ''' Add the columns a database written by an older citSupport lacks. '''
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(seeds)')]
+    if len(columns) > 0 and 'skipped' not in columns:
+        connection.execute('ALTER TABLE seeds ADD COLUMN skipped INTEGER DEFAULT 0')
+        connection.commit()
+
+class runDatabase():
+    ''' Record the results of a run (a call to doWork) in a SQLite database:
+    the heads of the repos under test, and the result of each seed and of each command run for it.
+    Results are queued and written by a thread of our own, in batches, each in one transaction,
+    so recording them never holds up the workers.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = Queue.Queue()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(schema)
+        upgrade(self.connection)
+        cursor = self.connection.execute('INSERT INTO runs (started, host) VALUES (?, ?)', (time.time(), socket.gethostname()))
+        self.run = cursor.lastrowid
+        self.connection.commit()
+        self.writer = threading.Thread(target=self.write, name='runDatabase')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def heads(self, repos):
+        ''' Record the heads of the repos we're testing. '''
+        for path in sorted(repos.repoMap.keys()):
+            repo = repos.repoMap[path]
+            if repo.repo is not None:
+                self.queue.put(('head', path, repo.localhead.hexsha))
+
+    def seedDone(self, seed, result, timedOut, records, bucket = None, skipped = False):
+        ''' Record the result of a seed (and the signature of its failure),
+        and the records (from testRun) of the commands run for it.
+        A skipped seed (its design already tested) neither passed nor failed.
+        '''
+        self.queue.put(('seed', seed, result, timedOut, list(records), bucket, skipped, time.time()))
+
+    def failures(self):
+        ''' Return a list of (seed, bucket, time of its last failure) for the seeds which still fail
+        (a seed which has passed since it last failed is fixed; one skipped since tells us nothing).
+        '''
+        # The writer owns our connection, so use one of our own.
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute('''SELECT seed, bucket, time FROM seeds AS latest
+                                         WHERE result != 0 AND NOT skipped
+                                               AND NOT EXISTS (SELECT 1 FROM seeds AS later
+                                                               WHERE later.seed = latest.seed AND later.id > latest.id AND NOT later.skipped)''').fetchall()
+        finally:
+            connection.close()
+
+    def insert(self, item):
+        if item[0] == 'head':
+            (_, path, sha) = item
+            self.connection.execute('INSERT INTO heads (run, repo, sha) VALUES (?, ?, ?)', (self.run, path, sha))
+            return
+        (_, seed, result, timedOut, records, bucket, skipped, finished) = item
+        started = records[0]['time'] if len(records) > 0 else finished
+        cursor = self.connection.execute('INSERT INTO seeds (run, seed, time, result, timedout, wall, bucket, skipped) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                         (self.run, seed, started, result, 1 if timedOut else 0, finished - started, bucket, 1 if skipped else 0))
+        seedId = cursor.lastrowid
+        self.connection.executemany('INSERT INTO commands (seed, idx, step, command, how, retcode, wall, user, sys, maxrss) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    [(seedId, r['index'], r['step'], r['command'], r['how'], r['retcode'], r['wall'],
+                                      r.get('user'), r.get('sys'), r.get('maxrss')) for r in records])
+        self.connection.execute('UPDATE runs SET seeds = seeds + 1, failures = failures + ? WHERE id = ?',
+                                (1 if result != 0 else 0, self.run))
+
+    def write(self):
+        ''' Write what's queued, committing at most every commitSeconds. '''
+        done = False
+        while not done:
+            item = self.queue.get()
+            deadline = time.time() + commitSeconds
+            while True:
+                if item is None:
+                    done = True
+                    break
+                try:
+                    self.insert(item)
+                except sqlite3.Error as e:
+                    print >>sys.stderr, 'runDatabase.write: %s' % (e)
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                except Queue.Empty:
+                    break
+            self.connection.commit()
+
+    def close(self):
+        ''' Write anything still queued and note the end of the run. '''
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.execute('UPDATE runs SET finished = ? WHERE id = ?', (time.time(), self.run))
+        self.connection.commit()
+        self.connection.close()
+
+def regressions(path, perBucket = 1):
+    ''' Return (old heads, new heads, suspects) for the last time the heads of the repos changed:
+    each heads a map of repo to sha, and suspects a map of the buckets of the seeds which failed
+    with the new heads (but never with the old ones) to (up to perBucket of) those seeds.
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        heads = {}
+        for (run, repo, sha) in connection.execute('SELECT run, repo, sha FROM heads'):
+            heads.setdefault(run, {})[repo] = sha
+        runs = sorted(heads.keys(), reverse=True)
+        if len(runs) == 0:
+            return ({}, {}, {})
+        newHeads = heads[runs[0]]
+        older = [run for run in runs if heads[run] != newHeads]
+        if len(older) == 0:
+            return ({}, newHeads, {})
+        oldHeads = heads[older[0]]
+        def failing(wanted):
+            matching = [run for run in runs if heads[run] == wanted]
+            return connection.execute('SELECT bucket, seed FROM seeds WHERE result != 0 AND run IN (%s) ORDER BY time'
+                                      % (','.join(['?'] * len(matching))), matching).fetchall()
+        oldBuckets = set([bucket for (bucket, seed) in failing(oldHeads)])
+        suspects = collections.OrderedDict()
+        for (bucket, seed) in failing(newHeads):
+            if bucket in oldBuckets:
+                continue
+            seeds = suspects.setdefault(bucket, [])
+            if len(seeds) < perBucket and seed not in seeds:
+                seeds.append(seed)
+        return (oldHeads, newHeads, suspects)
+    finally:
+        connection.close()
+
+queries = {
+    'runs' : ('the most recent runs',
+              '''SELECT runs.id, datetime(runs.started, 'unixepoch'), runs.seeds, runs.failures,
+                        group_concat(substr(heads.sha, 1, 10), ' ')
+                 FROM runs LEFT JOIN heads ON heads.run = runs.id
+                 GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?''', ['limit']),
+    'failures' : ('the seeds which failed (on a commit, given a prefix of its sha)',
+                  '''SELECT DISTINCT seeds.seed, seeds.run, seeds.result, seeds.timedout, seeds.bucket, datetime(seeds.time, 'unixepoch')
+                     FROM seeds LEFT JOIN heads ON heads.run = seeds.run
+                     WHERE seeds.result != 0 AND (heads.sha LIKE ? || '%' OR ? = '')
+                     ORDER BY seeds.time DESC LIMIT ?''', ['commit', 'commit', 'limit']),
+    'buckets' : ('the failure buckets (by signature) of a commit (or of all of them)',
+                 '''SELECT seeds.bucket, count(DISTINCT seeds.seed), max(datetime(seeds.time, 'unixepoch')), min(seeds.seed)
+                    FROM seeds LEFT JOIN heads ON heads.run = seeds.run
+                    WHERE seeds.result != 0 AND (heads.sha LIKE ? || '%' OR ? = '')
+                    GROUP BY seeds.bucket ORDER BY count(DISTINCT seeds.seed) DESC LIMIT ?''', ['commit', 'commit', 'limit']),
+    'seed' : ('the history of a seed (is it flaky?)',
+              '''SELECT seeds.run, datetime(seeds.time, 'unixepoch'), seeds.result, seeds.timedout, seeds.wall,
+                        (SELECT group_concat(substr(sha, 1, 10), ' ') FROM heads WHERE heads.run = seeds.run)
+                 FROM seeds WHERE seeds.seed = ? AND NOT seeds.skipped ORDER BY seeds.time DESC LIMIT ?''', ['seed', 'limit']),
+    'flaky' : ('seeds which both passed and failed with the same heads',
+               '''SELECT seeds.seed, coalesce(runHeads.heads, 'run ' || seeds.run), sum(seeds.result = 0), sum(seeds.result != 0)
+                  FROM seeds LEFT JOIN (SELECT run, group_concat(substr(sha, 1, 10), ' ') AS heads
+                                        FROM (SELECT run, sha FROM heads ORDER BY run, sha) GROUP BY run) AS runHeads
+                                   ON runHeads.run = seeds.run
+                  WHERE NOT seeds.skipped
+                  GROUP BY seeds.seed, coalesce(runHeads.heads, 'run ' || seeds.run)
+                  HAVING sum(seeds.result = 0) > 0 AND sum(seeds.result != 0) > 0
+                  ORDER BY max(seeds.run) DESC LIMIT ?''', ['limit']),
+    'steps' : ('the mean time of each step in each run',
+               '''SELECT seeds.run, commands.step, count(*), avg(commands.wall), max(commands.wall), avg(commands.maxrss)
+                  FROM commands JOIN seeds ON commands.seed = seeds.id
+                  GROUP BY seeds.run, commands.step
+                  ORDER BY seeds.run DESC, min(commands.idx) LIMIT ?''', ['limit']),
+}
+
+def main(argv=None):
+    ''' Query a run database. '''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = ArgumentParser(description='Query a citSupport run database.')
+    parser.add_argument('database', help='the database (written by citSupport --database)')
+    parser.add_argument('query', help='; '.join(['%s: %s' % (name, queries[name][0]) for name in sorted(queries.keys())]),
+                        choices=sorted(queries.keys()))
+    parser.add_argument('-c', '--commit', dest='commit', help='commit (sha prefix) for "failures" and "buckets"', default='')
+    parser.add_argument('-s', '--seed', dest='seed', help='seed for "seed"', default=None)
+    parser.add_argument('-n', '--limit', dest='limit', help='maximum number of rows [default: %(default)s]', type=int, default=50)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.database):
+        print >>sys.stderr, 'runDatabase: %s doesn\'t exist' % (args.database)
+        return 1
+    if args.query == 'seed' and args.seed is None:
+        parser.error('"seed" needs --seed')
+    (description, sql, parameters) = queries[args.query]
+    connection = sqlite3.connect(args.database)
+    upgrade(connection)
+    for row in connection.execute(sql, [getattr(args, p) for p in parameters]):
+        print '\t'.join(['' if v is None else str(v) for v in row])
+    connection.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
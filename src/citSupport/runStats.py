@@ -0,0 +1,114 @@
+'''
+Created on Oct 18, 2026
+'''
+import bisect
+import collections
+import json
+import threading
+import time
+
+from metricsServer import metric, sample
+
+# How many of the most recent durations of each step we summarize.
+windowSize = 10000
+# The upper bounds (in seconds) of the buckets of our histograms of durations (for metrics).
+durationBuckets = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0]
+
+def percentile(values, p):
+    ''' Return the p'th percentile of a sorted list of values. '''
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, int(p * len(values) / 100.0))]
+
+class runStats():
+    ''' Collect the records of commands run by testRun,
+    writing them (one JSON object per line) to a stream, and keep
+    a rolling summary of how long each step takes.
+    '''
+
+    def __init__(self, stream = None):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.seeds = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.failures = 0
+        self.durations = collections.OrderedDict()
+        self.counts = {}
+        self.cpu = {}
+        self.maxrss = {}
+        # For each step, the number of durations in each of durationBuckets (and beyond the last), and their total.
+        self.histograms = {}
+        self.totals = {}
+
+    def record(self, record):
+        ''' Add the record of one command. '''
+        with self.lock:
+            if self.stream is not None:
+                self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+            step = record['step']
+            if step not in self.durations:
+                self.durations[step] = collections.deque(maxlen=windowSize)
+                self.counts[step] = 0
+                self.cpu[step] = 0.0
+                self.maxrss[step] = 0
+                self.histograms[step] = [0] * (len(durationBuckets) + 1)
+                self.totals[step] = 0.0
+            self.durations[step].append(record['wall'])
+            self.histograms[step][bisect.bisect_left(durationBuckets, record['wall'])] += 1
+            self.totals[step] += record['wall']
+            self.counts[step] += 1
+            self.cpu[step] += record.get('user', 0.0) + record.get('sys', 0.0)
+            self.maxrss[step] = max(self.maxrss[step], record.get('maxrss', 0))
+
+    def seedDone(self, count = 1, timedOut = 0, skipped = 0, failed = 0):
+        with self.lock:
+            self.seeds += count
+            self.timeouts += timedOut
+            self.skipped += skipped
+            self.failures += failed
+            if self.stream is not None:
+                self.stream.flush()
+
+    def summary(self):
+        ''' Return a (printable) summary of our steps. '''
+        with self.lock:
+            elapsed = time.time() - self.start
+            lines = ['%d seeds (%d timed out, %d skipped) in %.0f seconds (%.1f seeds/hour)'
+                     % (self.seeds, self.timeouts, self.skipped, elapsed, self.seeds * 3600.0 / max(elapsed, 1.0))]
+            lines.append('%-24s %8s %8s %8s %8s %10s %10s' % ('step', 'count', 'p50', 'p95', 'max', 'cpu', 'maxrss'))
+            for step, durations in self.durations.iteritems():
+                values = sorted(durations)
+                lines.append('%-24s %8d %8.2f %8.2f %8.2f %10.1f %10d'
+                             % (step, self.counts[step], percentile(values, 50), percentile(values, 95),
+                                values[-1], self.cpu[step], self.maxrss[step]))
+        return '\n'.join(lines)
+
+    def metrics(self, prefix):
+        ''' Return our counters and histograms, as a list of lines in the Prometheus text format. '''
+        with self.lock:
+            counters = [('seeds', self.seeds, 'Seeds run.'),
+                        ('seeds_passed', self.seeds - self.failures, 'Seeds which passed (or were skipped).'),
+                        ('seeds_failed', self.failures, 'Seeds which failed (including those which timed out).'),
+                        ('seeds_timed_out', self.timeouts, 'Seeds which ran out of time.'),
+                        ('seeds_skipped', self.skipped, 'Seeds skipped as duplicates.')]
+            histograms = [(step, list(self.histograms[step]), self.totals[step]) for step in self.durations.iterkeys()]
+        lines = []
+        for (name, value, help) in counters:
+            lines += metric('%s_%s_total' % (prefix, name), 'counter', help, [sample('%s_%s_total' % (prefix, name), value)])
+        name = '%s_command_duration_seconds' % (prefix)
+        samples = []
+        for (step, counts, total) in histograms:
+            cumulative = 0
+            for bound, count in zip(durationBuckets + ['+Inf'], counts):
+                cumulative += count
+                samples.append(sample(name + '_bucket', cumulative, [('step', step), ('le', bound)]))
+            samples.append(sample(name + '_sum', total, [('step', step)]))
+            samples.append(sample(name + '_count', cumulative, [('step', step)]))
+        return lines + metric(name, 'histogram', 'Wall clock time of each step of the test commands.', samples)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
@@ -0,0 +1,270 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import json
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+# How long a worker may hold a lease without renewing it.
+defaultLeaseSeconds = 300
+# How long a worker waits to ask again when all the seeds are leased, but some leases may yet be reassigned.
+retrySeconds = 5.0
+
+class lease():
+    def __init__(self, number, worker, seeds, connection, seconds):
+        self.number = number
+        self.worker = worker
+        self.seeds = set(seeds)
+        self.connection = connection
+        self.expires = time.time() + seconds
+
+class coordinatorServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class coordinatorHandler(SocketServer.StreamRequestHandler):
+    ''' Answer a worker's requests (one JSON object per line) until it hangs up. '''
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        connection = object()
+        try:
+            for line in iter(self.rfile.readline, ''):
+                try:
+                    request = json.loads(line)
+                    reply = coordinator.request(request, connection)
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = { 'error' : str(e) }
+                self.wfile.write(json.dumps(reply) + '\n')
+                self.wfile.flush()
+        except socket.error:
+            pass
+        finally:
+            # The worker has gone. Give its seeds to someone else.
+            coordinator.release(connection)
+
+class seedCoordinator():
+    ''' Hand out seeds (from nextSeed) to worker processes, as leases, over TCP.
+    The protocol is one JSON object per line, each request answered by one reply:
+        {"op": "lease", "worker": name, "count": n} -> {"lease": id, "seeds": [...], "seconds": s}
+                                                     or {"seeds": [], "retry": s} or {"done": true}
+        {"op": "renew", "lease": id} -> {"ok": true|false}
+        {"op": "result", "lease": id, "seed": seed, "result": code, ...} -> {"ok": true|false}
+    The seeds of a lease which isn't renewed in time, or whose worker hangs up,
+    are given to the next worker to ask. Each accepted result is passed to onResult.
+    '''
+
+    def __init__(self, nextSeed, onResult, port, address = '', leaseSeconds = defaultLeaseSeconds, verbose = 0):
+        self.nextSeed = nextSeed
+        self.onResult = onResult
+        self.leaseSeconds = leaseSeconds
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.leases = {}
+        self.requeued = collections.deque()
+        self.leaseNumber = 0
+        self.exhausted = False
+        self.stopped = False
+        self.reassigned = 0
+        self.server = coordinatorServer((address, port), coordinatorHandler)
+        self.server.coordinator = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def request(self, request, connection):
+        op = request['op']
+        if op == 'lease':
+            return self.lease(request['worker'], int(request.get('count', 1)), connection)
+        elif op == 'renew':
+            return self.renew(request['lease'])
+        elif op == 'result':
+            return self.result(request)
+        raise ValueError('unknown op "%s"' % (op))
+
+    def lease(self, worker, count, connection):
+        with self.lock:
+            self.expire()
+            if self.stopped:
+                return { 'done' : True }
+            seeds = []
+            while len(seeds) < count and len(self.requeued) > 0:
+                seeds.append(self.requeued.popleft())
+            while len(seeds) < count and not self.exhausted:
+                seed = self.nextSeed()
+                if seed is None:
+                    self.exhausted = True
+                else:
+                    seeds.append(seed)
+            if len(seeds) == 0:
+                if len(self.leases) > 0:
+                    return { 'seeds' : [], 'retry' : retrySeconds }
+                return { 'done' : True }
+            self.leaseNumber += 1
+            number = self.leaseNumber
+            self.leases[number] = lease(number, worker, seeds, connection, self.leaseSeconds)
+        if self.verbose > 0:
+            print >>sys.stderr, 'seedCoordinator.lease: %d %s to %s' % (number, seeds, worker)
+        return { 'lease' : number, 'seeds' : seeds, 'seconds' : self.leaseSeconds }
+
+    def renew(self, number):
+        with self.lock:
+            l = self.leases.get(number)
+            if l is None:
+                return { 'ok' : False }
+            l.expires = time.time() + self.leaseSeconds
+            return { 'ok' : True }
+
+    def result(self, report):
+        ''' Accept the result of a seed, unless we've already had one for it. '''
+        seed = report['seed']
+        with self.lock:
+            holder = self.leases.get(report.get('lease'))
+            if holder is None or seed not in holder.seeds:
+                # Its lease may have expired, and the seed been given to someone else.
+                holder = None
+                for l in self.leases.values():
+                    if seed in l.seeds:
+                        holder = l
+                        break
+            if holder is not None:
+                holder.seeds.discard(seed)
+                if len(holder.seeds) == 0:
+                    del self.leases[holder.number]
+            elif seed in self.requeued:
+                self.requeued.remove(seed)
+            else:
+                return { 'ok' : False }
+        self.onResult(report)
+        return { 'ok' : True }
+
+    def requeue(self, leases):
+        ''' Give the seeds of leases to the next worker to ask. (We hold our lock.) '''
+        for l in leases:
+            del self.leases[l.number]
+            self.requeued.extend(sorted(l.seeds))
+            self.reassigned += len(l.seeds)
+            print >>sys.stderr, 'seedCoordinator: reassigning %d seeds from %s' % (len(l.seeds), l.worker)
+
+    def expire(self):
+        now = time.time()
+        self.requeue([l for l in self.leases.values() if l.expires < now])
+
+    def release(self, connection):
+        with self.lock:
+            self.requeue([l for l in self.leases.values() if l.connection is connection])
+
+    def finished(self):
+        ''' Have all the seeds been run (or have we been stopped)? '''
+        with self.lock:
+            return self.stopped or (self.exhausted and len(self.leases) == 0 and len(self.requeued) == 0)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='seedCoordinator')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        ''' Stop handing out seeds. Workers will be told we're done. '''
+        with self.lock:
+            self.stopped = True
+
+    def shutdown(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.thread = None
+
+class coordinatorClient():
+    ''' A worker's connection to a seedCoordinator.
+    next() returns the next seed (leasing count of them at a time) or None when there are no more,
+    and result() reports a seed's result. Leases are renewed while we hold them.
+    '''
+
+    def __init__(self, host, port, worker, count = 1):
+        self.worker = worker
+        self.count = count
+        self.lock = threading.Lock()
+        self.socket = socket.create_connection((host, port))
+        self.reader = self.socket.makefile('r')
+        self.seeds = collections.deque()
+        # The lease of each seed we hold, and the seeds we hold under each lease.
+        self.leaseOf = {}
+        self.leases = {}
+        self.leaseSeconds = defaultLeaseSeconds
+        self.done = False
+        self.closed = threading.Event()
+        self.renewer = threading.Thread(target=self.renew, name='coordinatorClient')
+        self.renewer.daemon = True
+        self.renewer.start()
+
+    def send(self, request):
+        ''' Send a request and return the reply. (We hold our lock.) '''
+        self.socket.sendall(json.dumps(request) + '\n')
+        line = self.reader.readline()
+        if line == '':
+            raise socket.error('coordinator hung up')
+        return json.loads(line)
+
+    def next(self):
+        modName = 'coordinatorClient.next'
+        while True:
+            with self.lock:
+                if len(self.seeds) > 0:
+                    return self.seeds.popleft()
+                if self.done:
+                    return None
+                try:
+                    reply = self.send({ 'op' : 'lease', 'worker' : self.worker, 'count' : self.count })
+                except (socket.error, ValueError) as e:
+                    print >>sys.stderr, '%s: %s' % (modName, e)
+                    self.done = True
+                    return None
+                if reply.get('done'):
+                    self.done = True
+                    return None
+                if 'lease' in reply:
+                    self.leaseSeconds = reply.get('seconds', self.leaseSeconds)
+                    self.leases[reply['lease']] = set(reply['seeds'])
+                    for seed in reply['seeds']:
+                        self.leaseOf[seed] = reply['lease']
+                    self.seeds.extend(reply['seeds'])
+                    continue
+            time.sleep(reply.get('retry', retrySeconds))
+
+    def result(self, seed, result, **kwargs):
+        ''' Report the result of a seed (with anything else the coordinator should know). '''
+        modName = 'coordinatorClient.result'
+        with self.lock:
+            number = self.leaseOf.pop(seed, None)
+            if number is not None:
+                self.leases[number].discard(seed)
+                if len(self.leases[number]) == 0:
+                    del self.leases[number]
+            report = { 'op' : 'result', 'lease' : number, 'worker' : self.worker, 'seed' : seed, 'result' : result }
+            report.update(kwargs)
+            try:
+                self.send(report)
+            except (socket.error, ValueError) as e:
+                print >>sys.stderr, '%s: %s' % (modName, e)
+
+    def renew(self):
+        ''' Renew the leases we hold, well before they expire. '''
+        while not self.closed.wait(self.leaseSeconds / 3.0):
+            with self.lock:
+                for number in self.leases.keys():
+                    try:
+                        self.send({ 'op' : 'renew', 'lease' : number })
+                    except (socket.error, ValueError):
+                        return
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            # The connection stays open until our reader (which shares it) is closed too.
+            self.reader.close()
+            self.socket.close()
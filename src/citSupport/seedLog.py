@@ -0,0 +1,77 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import gzip
+import os
+import re
+import threading
+
+# The longest line we'll keep in a tail (longer ones are split).
+maxLineLength = 8192
+unsafeRE = re.compile(r'[^\w.-]')
+
+def logPath(directory, seed):
+    return os.path.join(directory, unsafeRE.sub('_', seed) + '.log.gz')
+
+class seedLog():
+    ''' Capture the output of the commands run for a seed.
+    The output is read from pipes (so the commands never block on a full pipe),
+    written in full to a compressed log file, and the last few lines of
+    stdout and stderr are kept in memory for failure reports.
+    '''
+
+    def __init__(self, directory, seed, tailLines = 50):
+        self.path = logPath(directory, seed)
+        self.file = gzip.open(self.path, 'wb')
+        self.lock = threading.Lock()
+        self.stdoutTail = collections.deque(maxlen=tailLines)
+        self.stderrTail = collections.deque(maxlen=tailLines)
+        self.readers = []
+
+    def write(self, data):
+        with self.lock:
+            self.file.write(data)
+
+    def command(self, command):
+        ''' Note the start of a command in the log, and forget the tails of the previous one. '''
+        self.stdoutTail.clear()
+        self.stderrTail.clear()
+        self.write('$ %s\n' % (command))
+
+    def read(self, pipe, tail):
+        for line in iter(lambda: pipe.readline(maxLineLength), ''):
+            self.write(line)
+            tail.append(line)
+        pipe.close()
+
+    def capture(self, process):
+        ''' Start reading process's stdout and stderr. '''
+        for (pipe, tail) in [(process.stdout, self.stdoutTail), (process.stderr, self.stderrTail)]:
+            reader = threading.Thread(target=self.read, args=(pipe, tail))
+            reader.daemon = True
+            reader.start()
+            self.readers.append(reader)
+
+    def join(self, timeout = None):
+        ''' Wait until we've read everything the process wrote.
+        Return False if something (a child it left running) still has its output open after timeout seconds.
+        '''
+        for reader in self.readers:
+            reader.join(timeout)
+            if reader.is_alive():
+                return False
+        self.readers = []
+        return True
+
+    def tail(self):
+        ''' Return the tails of stdout and stderr (for a failure report). '''
+        return ''.join(self.stdoutTail) + ''.join(self.stderrTail)
+
+    def close(self, keep):
+        ''' Close the log, removing it unless we're told to keep it. '''
+        self.join()
+        with self.lock:
+            self.file.close()
+        if not keep:
+            os.remove(self.path)
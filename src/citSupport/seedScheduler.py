@@ -0,0 +1,63 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import threading
+
+def replayOrder(failures, limit):
+    ''' Order previously failing seeds for replay.
+    failures is a list of (seed, bucket, time of its last failure).
+    Buckets are taken most recently failing (then largest) first, a seed from each in turn,
+    so each known failure is checked as soon as possible. Return at most limit seeds.
+    '''
+    buckets = {}
+    for (seed, bucket, last) in failures:
+        buckets.setdefault(bucket, []).append((last, seed))
+    for seeds in buckets.values():
+        seeds.sort(reverse=True)
+    order = sorted(buckets.values(), key=lambda seeds: (-seeds[0][0], -len(seeds)))
+    replay = []
+    depth = 0
+    while len(replay) < limit and any([len(seeds) > depth for seeds in order]):
+        for seeds in order:
+            if depth < len(seeds) and len(replay) < limit:
+                replay.append(seeds[depth][1])
+        depth += 1
+    return replay
+
+class seedScheduler():
+    ''' Hand out seeds: first the (previously failing) seeds to replay,
+    then new ones from explore (until it returns None).
+    '''
+
+    def __init__(self, replay, explore):
+        self.replay = collections.deque(replay)
+        self.replaying = set(replay)
+        self.explore = explore
+        self.lock = threading.Lock()
+        self.passed = []
+        self.failed = []
+
+    def next(self):
+        with self.lock:
+            if len(self.replay) > 0:
+                return self.replay.popleft()
+        return self.explore()
+
+    def result(self, seed, result):
+        ''' Note the result of a seed, so we can report on those we replayed. '''
+        with self.lock:
+            if seed in self.replaying:
+                self.replaying.discard(seed)
+                if result == 0:
+                    self.passed.append(seed)
+                else:
+                    self.failed.append(seed)
+
+    def report(self):
+        with self.lock:
+            lines = ['replayed %d previously failing seeds: %d now pass, %d still fail, %d not run'
+                     % (len(self.passed) + len(self.failed) + len(self.replaying), len(self.passed), len(self.failed), len(self.replaying))]
+            if len(self.passed) > 0:
+                lines.append('now passing: %s' % (' '.join(self.passed)))
+        return '\n'.join(lines)
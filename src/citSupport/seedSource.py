@@ -0,0 +1,157 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import os
+import random
+import string
+import sys
+import threading
+
+class randomSeeds():
+    ''' An endless supply of random seeds. '''
+
+    def __init__(self, size = 8, chars = string.ascii_uppercase + string.digits):
+        self.size = size
+        self.chars = chars
+
+    def next(self):
+        return ''.join(random.choice(self.chars) for _ in range(self.size))
+
+    def done(self, seed):
+        pass
+
+    def close(self):
+        pass
+
+class oneSeed():
+    ''' Just the one seed. '''
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def next(self):
+        seed = self.seed
+        self.seed = None
+        return seed
+
+    def done(self, seed):
+        pass
+
+    def close(self):
+        pass
+
+class seedFile():
+    ''' Seeds read (one per line) from a file, as they're needed.
+    With shard (i, n), we read only the lines starting in the i'th of n equal parts of the file,
+    so n workers may share a file without splitting it.
+    With a checkpoint file, we remember (every checkpointEvery seeds) the offset in the file
+    before which every seed is done, and start from there next time.
+    '''
+
+    def __init__(self, path, shard = (0, 1), checkpointPath = None, checkpointEvery = 100):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        (i, n) = shard
+        self.start = size * i / n
+        self.end = size * (i + 1) / n
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        offset = self.start
+        if checkpointPath is not None and os.path.exists(checkpointPath):
+            with open(checkpointPath, 'r') as f:
+                saved = f.read().split()
+            # Ignore a checkpoint for some other part of the file.
+            if len(saved) == 3 and int(saved[1]) == self.start and int(saved[2]) == self.end:
+                offset = int(saved[0])
+                print >>sys.stderr, 'seedFile: resuming %s at byte %d' % (path, offset)
+        if offset > 0:
+            # The line containing our first byte belongs to the previous shard (unless it starts there).
+            self.file.seek(offset - 1)
+            self.file.readline()
+        # The (start offset, end offset, done) of each seed handed out (in order) and not yet checkpointed.
+        self.pending = collections.OrderedDict()
+        self.offsets = {}
+        self.completed = self.file.tell()
+        self.uncheckpointed = 0
+
+    def next(self):
+        with self.lock:
+            while self.file is not None:
+                offset = self.file.tell()
+                if offset >= self.end:
+                    break
+                line = self.file.readline()
+                if line == '':
+                    break
+                seed = line.strip()
+                if seed == '':
+                    continue
+                self.pending[offset] = [self.file.tell(), False]
+                self.offsets.setdefault(seed, collections.deque()).append(offset)
+                return seed
+            return None
+
+    def done(self, seed):
+        ''' Note that seed has been run, advancing (and perhaps saving) our checkpoint. '''
+        with self.lock:
+            offsets = self.offsets.get(seed)
+            if not offsets:
+                # Not one of ours.
+                return
+            self.pending[offsets.popleft()][1] = True
+            if len(offsets) == 0:
+                del self.offsets[seed]
+            while len(self.pending) > 0:
+                (offset, (end, done)) = next(self.pending.iteritems())
+                if not done:
+                    break
+                del self.pending[offset]
+                self.completed = end
+                self.uncheckpointed += 1
+            if self.uncheckpointed >= self.checkpointEvery:
+                self.checkpoint()
+
+    def checkpoint(self):
+        ''' Save our checkpoint (atomically). (We hold our lock.) '''
+        self.uncheckpointed = 0
+        if self.checkpointPath is None:
+            return
+        tmp = self.checkpointPath + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('%d %d %d\n' % (self.completed, self.start, self.end))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.checkpointPath)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.checkpoint()
+                self.file.close()
+                self.file = None
+
+def parseShard(spec):
+    ''' Parse "i/n" into (i, n). '''
+    (i, sep, n) = spec.partition('/')
+    if not i.isdigit() or not n.isdigit() or int(n) < 1 or int(i) >= int(n):
+        raise ValueError('bad shard "%s" (expected i/n, with 0 <= i < n)' % (spec))
+    return (int(i), int(n))
+
+def openSeeds(spec, directory, shard = (0, 1), checkpointEvery = 0):
+    ''' Return the seed source for spec: random seeds if it's None,
+    a file of seeds if it looks like a path (relative to directory), otherwise just that seed.
+    '''
+    if spec is None:
+        return randomSeeds()
+    if spec.find('/') < 0:
+        return oneSeed(spec)
+    path = os.path.join(directory, spec)
+    checkpointPath = None
+    if checkpointEvery > 0:
+        checkpointPath = path + '.checkpoint'
+        if shard[1] > 1:
+            checkpointPath += '.%dof%d' % shard
+    return seedFile(path, shard, checkpointPath, max(checkpointEvery, 1))
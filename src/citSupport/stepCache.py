@@ -0,0 +1,197 @@
+'''
+Created on Oct 18, 2026
+'''
+import collections
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# When the cache outgrows its limit, we evict down to this fraction of it, so we don't evict on every store.
+lowWater = 0.8
+
+class stepCache():
+    ''' A content addressed cache of the outputs of commands.
+    An entry's key is the hash of the (expanded) command, its input files
+    and a salt (identifying the tools in use). Entries are evicted least
+    recently used first when the cache grows beyond its size limit.
+    The sizes of the entries are kept in memory, least recently used first,
+    so we needn't look at the disk to decide what to evict.
+    '''
+
+    def __init__(self, directory, maxBytes, salt = '', verbose = 0):
+        self.directory = os.path.abspath(directory)
+        self.maxBytes = maxBytes
+        self.salt = salt
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # The size of each entry, least recently used first.
+        self.index = collections.OrderedDict()
+        for (_, path, size) in sorted(self.entries()):
+            self.index[path] = size
+        self.size = sum(self.index.itervalues())
+
+    def entries(self):
+        ''' Return a list of (last use, path, size) for the entries in the cache. '''
+        entries = []
+        for prefix in os.listdir(self.directory):
+            prefixDir = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefixDir):
+                continue
+            for name in os.listdir(prefixDir):
+                path = os.path.join(prefixDir, name)
+                entries.append((os.path.getmtime(path), path, self.entrySize(path)))
+        return entries
+
+    def entrySize(self, path):
+        size = 0
+        for (dirpath, _, filenames) in os.walk(path):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+        return size
+
+    def entryPath(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def key(self, command, inputs, cwd):
+        ''' Return the key for running command on inputs in cwd. '''
+        h = hashlib.sha1()
+        h.update(self.salt + '\0' + command + '\0')
+        for name in inputs:
+            h.update(name + '\0')
+            path = os.path.join(cwd, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 16), ''):
+                        h.update(block)
+            else:
+                h.update('\0missing\0')
+        return h.hexdigest()
+
+    def snapshot(self, outputs, cwd):
+        ''' Return the state of the outputs before running a command,
+        so we can tell what it produced.
+        '''
+        state = {}
+        for name in outputs:
+            for path in self.files(name, cwd):
+                s = os.stat(os.path.join(cwd, path))
+                state[path] = (s.st_mtime, s.st_size)
+        return state
+
+    def files(self, name, cwd):
+        ''' Return the files (relative to cwd) for an output, which may be a directory. '''
+        path = os.path.join(cwd, name)
+        if os.path.isfile(path):
+            return [name]
+        files = []
+        for (dirpath, _, filenames) in os.walk(path):
+            for filename in filenames:
+                files.append(os.path.relpath(os.path.join(dirpath, filename), cwd))
+        return files
+
+    def restore(self, key, cwd):
+        ''' Copy the outputs for key into cwd. Return False on a miss. '''
+        path = self.entryPath(key)
+        with self.lock:
+            if path in self.index:
+                size = self.index.pop(path)
+            elif os.path.isdir(path):
+                # Another process sharing the cache stored it.
+                size = self.entrySize(path)
+                self.size += size
+            else:
+                self.misses += 1
+                return False
+            # Mark it as recently used (on disk too, for the next process to use the cache).
+            self.index[path] = size
+            os.utime(path, None)
+        try:
+            for (dirpath, _, filenames) in os.walk(path):
+                relpath = os.path.relpath(dirpath, path)
+                destination = os.path.normpath(os.path.join(cwd, relpath))
+                if not os.path.isdir(destination):
+                    os.makedirs(destination)
+                for filename in filenames:
+                    shutil.copyfile(os.path.join(dirpath, filename), os.path.join(destination, filename))
+        except (IOError, OSError) as e:
+            # It was evicted (by another process) as we copied it. The command will run, and replace what we copied.
+            if self.verbose > 0:
+                print >>sys.stderr, 'stepCache.restore: %s: %s' % (path, e)
+            with self.lock:
+                if path in self.index:
+                    self.size -= self.index.pop(path)
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, outputs, cwd, before):
+        ''' Save the outputs a command produced (those that changed since before) for key. '''
+        path = self.entryPath(key)
+        if os.path.isdir(path):
+            return
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            try:
+                os.mkdir(parent)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        # Build the entry off to the side and rename it into place,
+        # so no one ever sees a partial entry.
+        tmp = tempfile.mkdtemp(dir=parent)
+        size = 0
+        for name in outputs:
+            for relpath in self.files(name, cwd):
+                source = os.path.join(cwd, relpath)
+                s = os.stat(source)
+                if before.get(relpath) == (s.st_mtime, s.st_size):
+                    continue
+                destination = os.path.join(tmp, relpath)
+                if not os.path.isdir(os.path.dirname(destination)):
+                    os.makedirs(os.path.dirname(destination))
+                shutil.copyfile(source, destination)
+                size += s.st_size
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Someone beat us to it.
+            shutil.rmtree(tmp)
+            return
+        with self.lock:
+            self.index[path] = size
+            self.size += size
+            victims = self.evict() if self.size > self.maxBytes else []
+        # Remove them once they're out of the index, without holding our lock.
+        for victim in victims:
+            if self.verbose > 0:
+                print >>sys.stderr, 'stepCache.evict: removing %s' % (victim)
+            shutil.rmtree(victim, ignore_errors=True)
+
+    def evict(self):
+        ''' Take the least recently used entries out of the index until we're under our low-water mark.
+        Return their paths, for the caller to remove. (We hold our lock.)
+        '''
+        victims = []
+        while self.size > self.maxBytes * lowWater and len(self.index) > 0:
+            (path, size) = self.index.popitem(last=False)
+            victims.append(path)
+            self.size -= size
+            self.evictions += 1
+        return victims
+
+    def report(self):
+        return 'stepCache: %d hits, %d misses, %d evictions, %d bytes' % (self.hits, self.misses, self.evictions, self.size)
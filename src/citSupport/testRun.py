@@ -4,12 +4,85 @@ Created on Jul 3, 2014
 @author: jrl
 '''
 import errno
+import fcntl
 import os
 import random
 import re
+import signal
 import string
 import subprocess
 import sys
+import threading
+import time
+
+# How long a command that has run out of time has to exit after SIGTERM, before we SIGKILL it.
+killGrace = 10
+
+variableRE = re.compile(r'\$\((\w+)\)')
+# Characters which need a shell to interpret them (a newline separates commands).
+shellCharsRE = re.compile(r'[|&;<>()$`\\"\'*?\[\]#~\t\n]')
+
+# The standard input of every command.
+devnull = open(os.devnull, 'r')
+
+class commandTemplate():
+    ''' A command, split (once) into its literal text and the variables to be substituted in it. '''
+
+    def __init__(self, command):
+        parts = variableRE.split(command)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+        # Do we need a shell whatever we substitute?
+        self.shell = shellCharsRE.search(''.join(self.literals)) is not None
+
+    def expand(self, variables):
+        ''' Return the command with the values of any variables we have substituted. '''
+        if len(self.names) == 0:
+            return self.literals[0]
+        pieces = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = variables.get(name) if variables is not None else None
+            pieces.append(value if value is not None else '$(%s)' % (name))
+            pieces.append(literal)
+        return ''.join(pieces)
+
+    def argv(self, expanded):
+        ''' Return the arguments to execute the expanded command directly, or None if it needs a shell. '''
+        if self.shell or (len(self.names) > 0 and shellCharsRE.search(expanded)):
+            return None
+        argv = expanded.split()
+        # An assignment to an environment variable.
+        if len(argv) == 0 or '=' in argv[0]:
+            return None
+        return argv
+
+# Where we can find our open files (on Linux).
+fdDirectory = '/proc/self/fd'
+listFds = os.path.isdir(fdDirectory)
+
+def prepareChild():
+    ''' In a child, before exec: give it a process group of its own (so we can kill everything it starts),
+    and mark our files (other than its stdin, stdout and stderr) close-on-exec. This is much cheaper than
+    subprocess's close_fds, which closes every possible file descriptor.
+    '''
+    os.setsid()
+    for name in os.listdir(fdDirectory):
+        fd = int(name)
+        if fd > 2:
+            try:
+                fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            except (IOError, OSError):
+                pass
+
+# The templates of the commands we've seen.
+templates = {}
+
+def compiled(command):
+    template = templates.get(command)
+    if template is None:
+        template = commandTemplate(command)
+        templates[command] = template
+    return template
 
 class testRun():
     ''' Run a sequence of commands:
@@ -18,25 +91,157 @@ class testRun():
         - and calling an external decision function to determine if execution should continue
     '''
 
-    def __init__(self, verbose = 0):
-        self.testVariableRE = re.compile(r'\$\((\w+)\)')
+    def __init__(self, verbose = 0, cwd = None, server = None, cache = None, stats = None,
+                 commandTimeout = None, seedTimeout = None):
         self.verbose = verbose
+        # The directory commands are run in (None means the current directory).
+        self.cwd = cwd
+        # An optional jvmServer to run scalac/scala commands.
+        self.server = server
+        # An optional stepCache for commands which declare their inputs and outputs.
+        self.cache = cache
+        # The command currently running, so another thread may abort it.
+        self.process = None
+        self.processLock = threading.Lock()
+        self.aborted = False
+        # An optional runStats to which we report each command's resource usage.
+        self.stats = stats
+        # The records (see run()) of the commands run by the last call to run().
+        self.records = []
+        # The semaphore for the stage of the commands we're running.
+        self.stage = None
+        # Wall clock limits (in seconds) for each command and each run() (None for no limit).
+        # A dict command may have its own 'timeout'.
+        self.commandTimeout = commandTimeout
+        self.seedTimeout = seedTimeout
+        # Is a command running (in a process or our server)? Has it finished (so it can no longer time out)?
+        # Did the last run() run out of time?
+        self.running = False
+        self.exited = False
+        self.timedOut = False
+        # An optional seedLog to capture the output of our commands (otherwise it goes to our stdout and stderr).
+        self.log = None
+        # The end of the stderr of the last command run (with a log) by the last call to run().
+        self.stderrTail = []
+        # The end of the log's stdout and stderr, as of the last command run (with a log) by the last call to run().
+        self.outputTail = ''
+        # Did the last run() stop early because a command's 'skip' function said the rest weren't needed?
+        self.skipped = False
+
+    def abort(self):
+        ''' Kill the running command (and anything it started) and don't run any more. '''
+        with self.processLock:
+            self.aborted = True
+            process = self.process
+            if process is not None:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        if process is not None:
+            # If it won't go quietly, make it.
+            timer = threading.Timer(killGrace, self.kill, [process])
+            timer.daemon = True
+            timer.start()
+        if self.server is not None:
+            self.server.abort()
+
+    def expire(self):
+        ''' The running command has run out of time. Kill it (and everything it started). '''
+        with self.processLock:
+            # Too late, if it's already finished.
+            if not self.running or self.exited:
+                return
+            self.timedOut = True
+            process = self.process
+            if process is not None:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        if process is None:
+            if self.server is not None:
+                self.server.interrupt()
+            return
+        # If it won't go quietly, make it.
+        timer = threading.Timer(killGrace, self.kill, [process])
+        timer.daemon = True
+        timer.start()
 
-    def run(self, commands, variables):
-        ''' Run a sequence of commands, stopping on the first non-zero exit code. '''
+    def kill(self, process):
+        with self.processLock:
+            if self.process is process:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+    def wait(self, process):
+        ''' Wait for process to exit.
+        Return its exit code (negative if it was killed by a signal) and its resource usage.
+        Once it has exited, it can no longer time out (whenever our watchdog fires).
+        '''
+        while True:
+            try:
+                (pid, status, rusage) = os.wait4(process.pid, 0)
+                break
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    retcode = process.wait()
+                    with self.processLock:
+                        self.exited = True
+                    return (retcode, None)
+                if e.errno != errno.EINTR:
+                    raise
+        with self.processLock:
+            self.exited = True
+        if os.WIFSIGNALED(status):
+            retcode = -os.WTERMSIG(status)
+        else:
+            retcode = os.WEXITSTATUS(status)
+        # We've reaped it, so subprocess mustn't try to.
+        process.returncode = retcode
+        return (retcode, rusage)
+
+    def run(self, commands, variables, stages = None):
+        ''' Run a sequence of commands, stopping on the first non-zero exit code.
+        A record of each command run (its seed, expanded command, exit code,
+        wall clock and cpu times and peak memory use) is kept in self.records
+        and sent to our runStats.
+        stages (if supplied) is a list of (index of first command, semaphore) pairs
+        dividing the commands into stages: we hold a stage's semaphore while
+        we run its commands, limiting the number of runs in each stage at once.
+        '''
+        self.records = []
+        self.stderrTail = []
+        self.outputTail = ''
+        self.timedOut = False
+        self.skipped = False
+        try:
+            return self.runCommands(commands, variables, stages)
+        finally:
+            if self.stage is not None:
+                self.stage.release()
+                self.stage = None
+
+    def enterStage(self, index, stages):
+        ''' Move to the stage containing the command at index (if it's a new one). '''
+        stage = None
+        for (first, semaphore) in stages:
+            if index >= first:
+                stage = semaphore
+        if stage is not self.stage:
+            if self.stage is not None:
+                self.stage.release()
+            self.stage = stage
+            if stage is not None:
+                stage.acquire()
+
+    def runCommands(self, commands, variables, stages):
+        ''' Run commands (see run()). '''
         retcode = 1
         modName = 'testRun.run'
-
-        def replaceVariable(matchobj):
-            ''' Replace a $(variable) with its value. '''
-            variable = matchobj.group(1)
-            if variable in variables.keys():
-                replacement = variables[variable]
-                if self.verbose > 1:
-                    print >>sys.stderr, '%s: replacing "$s" with "%s"' % (modName, variable, replacement)
-                return replacement
-            else:
-                return matchobj.group(0)
+        elapsed = 0.0
 
         def basicTestResult(command, retcode):
             ''' Evaluate the retcode returned by command and return False if execution should stop. '''
@@ -49,34 +254,174 @@ class testRun():
                 result = True
             return result
 
-        for command in commands:
+        def expand(s):
+            ''' Expand any variables in s. '''
+            return compiled(s).expand(variables)
+
+        for index, command in enumerate(commands):
+            if stages is not None:
+                self.enterStage(index, stages)
+            if self.aborted:
+                break
             baseCommand = None
             testResult = basicTestResult
+            cacheSpec = None
+            skip = None
+            step = None
+            timeout = self.commandTimeout
             # This may be:
             # - string: simple command, break on failure,
             # - tuple: (command, eval function),
-            # - map: (command and testResult entries)
+            # - map: (command and optional testResult, cache and skip entries)
             if type(command) is tuple:
                 (baseCommand, testResult) = command
             elif type(command) is dict:
                 baseCommand = command['command']
-                testResult = command['test']
+                testResult = command.get('test', basicTestResult)
+                cacheSpec = command.get('cache')
+                step = command.get('step')
+                skip = command.get('skip')
+                timeout = command.get('timeout', timeout)
             else:
                 baseCommand = command
+            if step is None:
+                step = '%d:%s' % (index, baseCommand.split(' ', 1)[0])
 
             # Does this command need a variable expanded?
-            if variables is None:
-                expandedCommand = baseCommand
-            else:
-                expandedCommand = self.testVariableRE.sub(replaceVariable, baseCommand)
+            template = compiled(baseCommand)
+            expandedCommand = template.expand(variables)
 
             if self.verbose > 0:
                 print >>sys.stderr, '%s: "%s" ...' % (modName, expandedCommand)
-            FNULL = open(os.devnull, 'r')
-            retcode = subprocess.call(expandedCommand, stdin=FNULL, shell=True, close_fds=True)
+            retcode = None
+            rusage = None
+            how = 'cache'
+            start = time.time()
+            cacheKey = None
+            if self.cache is not None and cacheSpec is not None:
+                cwd = self.cwd if self.cwd is not None else os.getcwd()
+                inputs = [expand(i) for i in cacheSpec['inputs']]
+                outputs = [expand(o) for o in cacheSpec['outputs']]
+                cacheKey = self.cache.key(expandedCommand, inputs, cwd)
+                if self.cache.restore(cacheKey, cwd):
+                    if self.verbose > 0:
+                        print >>sys.stderr, '%s: ... restored from cache' % (modName)
+                    retcode = 0
+                    cacheKey = None
+                else:
+                    before = self.cache.snapshot(outputs, cwd)
+            # How much time does this command have?
+            if self.seedTimeout is not None:
+                remaining = self.seedTimeout - elapsed
+                timeout = remaining if timeout is None else min(timeout, remaining)
+                if remaining <= 0:
+                    self.timedOut = True
+                    print >>sys.stderr, '%s: no time left for "%s"' % (modName, expandedCommand)
+                    retcode = 1
+                    break
+            watchdog = None
+            if retcode is None:
+                with self.processLock:
+                    self.running = True
+                    self.exited = False
+                if timeout is not None:
+                    watchdog = threading.Timer(timeout, self.expire)
+                    watchdog.daemon = True
+                    watchdog.start()
+            try:
+                if retcode is None and self.server is not None:
+                    how = 'server'
+                    retcode = self.server.run(expandedCommand)
+                    if retcode is not None:
+                        with self.processLock:
+                            self.exited = True
+                if retcode is None:
+                    # Run it directly, unless it needs the shell.
+                    argv = template.argv(expandedCommand)
+                    how = 'shell' if argv is None else 'exec'
+                    log = self.log
+                    output = None
+                    if log is not None:
+                        log.command(expandedCommand)
+                        output = subprocess.PIPE
+                    with self.processLock:
+                        if self.aborted:
+                            self.running = False
+                            break
+                        # Give the command a process group of its own, so we can kill everything it starts.
+                        try:
+                            self.process = subprocess.Popen(argv if argv is not None else expandedCommand,
+                                                            shell=argv is None, stdin=devnull, stdout=output, stderr=output,
+                                                            close_fds=not listFds, cwd=self.cwd,
+                                                            preexec_fn=prepareChild if listFds else os.setsid)
+                        except OSError as e:
+                            # Say what the shell would have.
+                            print >>sys.stderr, '%s: %s: %s' % (modName, argv[0] if argv is not None else expandedCommand, e.strerror)
+                            self.process = None
+                            retcode = 127
+                        if log is not None and self.process is not None:
+                            log.capture(self.process)
+                if retcode is None:
+                    (retcode, rusage) = self.wait(self.process)
+                    if self.timedOut or self.aborted:
+                        # Make sure nothing it started outlives it.
+                        try:
+                            os.killpg(self.process.pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+                    if log is not None and not log.join(killGrace):
+                        # Something it left running is holding its output open.
+                        try:
+                            os.killpg(self.process.pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+                        log.join()
+                    if log is not None:
+                        self.stderrTail = list(log.stderrTail)
+                        self.outputTail = log.tail()
+                with self.processLock:
+                    self.process = None
+                    self.running = False
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+            elapsed += time.time() - start
+            record = {
+                'time' : start,
+                'seed' : variables.get('seed') if variables is not None else None,
+                'index' : index,
+                'step' : step,
+                'command' : expandedCommand,
+                'how' : how,
+                'retcode' : retcode,
+                'wall' : time.time() - start,
+            }
+            if self.timedOut:
+                record['timedout'] = True
+            if rusage is not None:
+                record['user'] = rusage.ru_utime
+                record['sys'] = rusage.ru_stime
+                record['maxrss'] = rusage.ru_maxrss
+            self.records.append(record)
+            if self.stats is not None:
+                self.stats.record(record)
+            if self.aborted:
+                if self.verbose > 0:
+                    print >>sys.stderr, '%s: ... aborted' % (modName)
+                break
+            if self.timedOut:
+                print >>sys.stderr, '%s: "%s" timed out after %.0f seconds' % (modName, expandedCommand, timeout)
+                break
+            if cacheKey is not None and retcode == 0:
+                self.cache.store(cacheKey, outputs, cwd, before)
             if self.verbose > 0:
                 print >>sys.stderr, '%s: ... returned %d' % (modName, retcode)
             if not testResult(expandedCommand, retcode):
                 break
+            if skip is not None and skip(self.cwd if self.cwd is not None else os.getcwd(), variables):
+                if self.verbose > 0:
+                    print >>sys.stderr, '%s: ... skipping the rest' % (modName)
+                self.skipped = True
+                break
         return retcode
 
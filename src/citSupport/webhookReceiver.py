@@ -0,0 +1,116 @@
+'''
+Created on Oct 18, 2026
+'''
+import BaseHTTPServer
+import hashlib
+import hmac
+import json
+import SocketServer
+import sys
+import threading
+
+class webhookHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class webhookHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    ''' Accept GitHub webhook deliveries, and pass (verified) push events to our receiver. '''
+
+    def reply(self, code, message):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(message + '\n')
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return self.reply(400, 'bad Content-Length')
+        body = self.rfile.read(length)
+        if not receiver.verify(body, self.headers):
+            return self.reply(403, 'bad signature')
+        event = self.headers.get('X-GitHub-Event')
+        if event == 'ping':
+            return self.reply(200, 'pong')
+        if event != 'push':
+            return self.reply(202, 'ignored %s' % (event))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self.reply(400, 'bad payload')
+        matched = receiver.push(payload)
+        self.reply(200, 'matched %d' % (len(matched)))
+
+    def log_message(self, format, *args):
+        if self.server.receiver.verbose > 0:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class webhookReceiver():
+    ''' Listen for GitHub push webhooks, and tell MonitorRepos
+    (without any polling) when one of its repositories has changed.
+    '''
+
+    def __init__(self, repos, secret, port, address = '', verbose = 0):
+        self.repos = repos
+        self.secret = secret
+        self.verbose = verbose
+        self.server = webhookHTTPServer((address, port), webhookHandler)
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def verify(self, body, headers):
+        ''' Verify the HMAC signature GitHub computed with our shared secret. '''
+        signature = headers.get('X-Hub-Signature-256')
+        if signature is None:
+            signature = headers.get('X-Hub-Signature')
+        if signature is None:
+            return False
+        (algorithm, sep, hexdigest) = signature.partition('=')
+        digests = { 'sha256' : hashlib.sha256, 'sha1' : hashlib.sha1 }
+        if algorithm not in digests:
+            return False
+        expected = hmac.new(self.secret, body, digests[algorithm]).hexdigest()
+        return hmac.compare_digest(str(hexdigest), expected)
+
+    def push(self, payload):
+        ''' Note the new head for any of our repos matching the pushed repository and branch.
+        Return the names of the matching repos.
+        '''
+        modName = 'webhookReceiver.push'
+        try:
+            fullName = payload['repository']['full_name'].lower()
+            ref = payload['ref']
+            head = payload['after']
+        except (KeyError, TypeError, AttributeError):
+            print >>sys.stderr, '%s: unexpected payload' % (modName)
+            return []
+        matched = []
+        for name, repo in self.repos.repoMap.items():
+            reponame = repo.remotereponame
+            if reponame.endswith('.git'):
+                reponame = reponame[:-4]
+            if ('%s/%s' % (repo.remoteowner, reponame)).lower() != fullName:
+                continue
+            if repo.repo is None or ref != 'refs/heads/' + repo.trackingbranch:
+                continue
+            repo.pushedhead = head
+            matched.append(name)
+        if self.verbose > 0:
+            print >>sys.stderr, '%s: %s %s %s matches %s' % (modName, fullName, ref, head, matched)
+        if len(matched) > 0:
+            self.repos.noteChanges([name for name in matched if self.repos.repoMap[name].isChanged()])
+        return matched
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='webhookReceiver')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,135 @@
+'''
+Created on Oct 18, 2026
+'''
+import errno
+import fcntl
+import glob
+import os
+import shutil
+import sys
+import threading
+
+workspacePrefix = 'ws.'
+lockSuffix = '.lock'
+
+class workspacePool():
+    ''' A pool of initialized test directories (workspaces), which may be on a RAM backed filesystem.
+    A workspace is set up once and reset between seeds by removing only what a seed leaves in it
+    (outputs, a list of glob patterns). Workspaces are left set up for the next run,
+    except those with failures, which are moved to persistent storage.
+    Nothing is removed from a directory without our canary file in it.
+    Each workspace in use has a lock file (ws.N.lock) beside it, which its pool holds (with flock)
+    until it's closed, so several runs may share a root: a run takes over only the workspaces no one holds.
+    '''
+
+    def __init__(self, root, keepDir, setup, outputs, canary, verbose = 0):
+        ''' setup is called to initialize a new workspace (and must create the canary). '''
+        self.root = os.path.abspath(root)
+        self.keepDir = os.path.abspath(keepDir)
+        self.setup = setup
+        self.outputs = outputs
+        self.canary = canary
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        for directory in [self.root, self.keepDir]:
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        # The file descriptors of the locks we hold, by workspace.
+        self.locks = {}
+        # Workspaces left by a previous run (which no one else is using) are ready to use.
+        self.free = sorted([path for path in glob.glob(os.path.join(self.root, workspacePrefix + '*'))
+                            if self.isWorkspace(path) and self.claim(path)])
+        self.created = 0
+
+    def isWorkspace(self, path):
+        return os.path.isfile(os.path.join(path, self.canary))
+
+    def claim(self, path):
+        ''' Lock a workspace. Return False if someone else holds it. '''
+        fd = os.open(path + lockSuffix, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            os.close(fd)
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+        # Its owner may have moved it (and released it) since we looked.
+        if not os.path.isdir(path):
+            os.close(fd)
+            return False
+        self.locks[path] = fd
+        return True
+
+    def unclaim(self, path):
+        ''' Release (and remove) a workspace's lock, since it's no longer a workspace. '''
+        os.remove(path + lockSuffix)
+        os.close(self.locks.pop(path))
+
+    def acquire(self):
+        ''' Return the path of a workspace, ready to use. '''
+        with self.lock:
+            if len(self.free) > 0:
+                path = self.free.pop(0)
+                self.reset(path)
+                return path
+            # Find a name no one is using.
+            while True:
+                path = os.path.join(self.root, '%s%d.%d' % (workspacePrefix, os.getpid(), self.created))
+                self.created += 1
+                try:
+                    os.mkdir(path)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                    continue
+                # Hold it before its canary exists, so no one else takes it over.
+                if self.claim(path):
+                    break
+        if self.verbose > 0:
+            print >>sys.stderr, 'workspacePool.acquire: setting up %s' % (path)
+        self.setup(path)
+        return path
+
+    def reset(self, path):
+        ''' Remove what the last seed left in a workspace. '''
+        if not self.isWorkspace(path):
+            raise ValueError('%s isn\'t one of our workspaces' % (path))
+        for pattern in self.outputs:
+            for name in glob.glob(os.path.join(path, pattern)):
+                if os.path.isdir(name) and not os.path.islink(name):
+                    shutil.rmtree(name, ignore_errors=True)
+                else:
+                    os.remove(name)
+
+    def release(self, path):
+        ''' Reset a workspace and put it back in the pool. '''
+        self.reset(path)
+        with self.lock:
+            self.free.append(path)
+
+    def keep(self, path, name):
+        ''' Move a workspace (with a failure in it) to persistent storage as name. Return where it went. '''
+        if not self.isWorkspace(path):
+            raise ValueError('%s isn\'t one of our workspaces' % (path))
+        kept = os.path.join(self.keepDir, name)
+        if os.path.exists(kept):
+            kept = '%s.%d' % (kept, os.getpid())
+        # This copies it if it's on another filesystem.
+        shutil.move(path, kept)
+        # It's no longer ours to remove.
+        os.remove(os.path.join(kept, self.canary))
+        with self.lock:
+            self.unclaim(path)
+        return kept
+
+    def close(self):
+        ''' Release our workspaces (left set up) for the next run. '''
+        with self.lock:
+            for fd in self.locks.itervalues():
+                os.close(fd)
+            self.locks = {}
+            self.free = []
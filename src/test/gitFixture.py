@@ -0,0 +1,40 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import shutil
+import tempfile
+
+from git import Repo
+
+class gitFixture():
+    ''' A bare repository (standing in for a remote), in a temporary directory,
+    and clones of it (with commits on master and a branch dev).
+    '''
+
+    def __init__(self, owner = 'owner', name = 'widget.git'):
+        self.directory = tempfile.mkdtemp(prefix='citSupport.')
+        self.remotePath = os.path.join(self.directory, owner, name)
+        Repo.init(self.remotePath, bare=True)
+        seeder = self.clone('seeder')
+        seeder.git.symbolic_ref('HEAD', 'refs/heads/master')
+        self.commit(seeder, 'first')
+        seeder.git.push('origin', 'master')
+        seeder.git.push('origin', 'master:dev')
+
+    def clone(self, name, branch = 'master'):
+        ''' Clone the remote (checking out branch), and tell git who we are there. '''
+        path = os.path.join(self.directory, name)
+        clone = Repo.clone_from(self.remotePath, path)
+        clone.git.config('user.name', 'citSupport test')
+        clone.git.config('user.email', 'test@example.com')
+        if clone.head.is_valid() and branch != clone.head.ref.name:
+            clone.git.checkout('-b', branch, '--track', 'origin/' + branch)
+        return clone
+
+    def commit(self, clone, message):
+        clone.git.commit('--allow-empty', '-m', message)
+        return clone.head.commit.hexsha
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,102 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+import unittest
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+import citSupport
+import monitorRepos
+from metricsServer import metricsServer, contentType
+from monitorRepos import MonitorRepos
+from runStats import runStats
+from gitFixture import gitFixture
+
+def parse(text):
+    ''' Return a map of each sample (name and labels, as written) to its value. '''
+    samples = {}
+    for line in text.splitlines():
+        if line == '' or line.startswith('#'):
+            continue
+        (name, sep, value) = line.rpartition(' ')
+        samples[name] = float(value)
+    return samples
+
+class testMetricsServer(unittest.TestCase):
+    ''' Scrape the metrics of a run (its stats, and the repos it monitors) from localhost. '''
+
+    def setUp(self):
+        monitorRepos.remoteHeads.clear()
+        monitorRepos.trackedBranches.clear()
+        self.fixture = gitFixture()
+        self.addCleanup(self.fixture.close)
+        self.good = self.fixture.clone('good').working_dir + '#git'
+        broken = self.fixture.clone('broken')
+        broken.git.remote('set-url', 'origin', os.path.join(self.fixture.directory, 'nowhere.git'))
+        self.broken = broken.working_dir + '#git'
+        self.repos = MonitorRepos([self.good, self.broken], backend='git')
+        stats = runStats()
+        for wall in [0.2, 0.7, 700.0]:
+            stats.record({ 'step' : '1:scalac', 'wall' : wall })
+        stats.record({ 'step' : '0:firrtl-torture', 'wall' : 0.05 })
+        stats.seedDone(3, timedOut=1, failed=2)
+        self.addCleanup(setattr, citSupport, 'stats', citSupport.stats)
+        citSupport.stats = stats
+        self.server = metricsServer(lambda: citSupport.collectMetrics([], self.repos), 0, '127.0.0.1')
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def get(self, path):
+        ''' GET path, and return the response's status, content type and body. '''
+        try:
+            response = urllib2.urlopen('http://127.0.0.1:%d%s' % (self.server.port, path), timeout=10)
+        except urllib2.HTTPError as e:
+            return (e.code, None, e.read())
+        return (response.getcode(), response.info().getheader('Content-Type'), response.read())
+
+    def testSeedCounters(self):
+        (status, kind, body) = self.get('/metrics')
+        self.assertEqual(status, 200)
+        self.assertEqual(kind, contentType)
+        samples = parse(body)
+        self.assertEqual(samples['citsupport_seeds_total'], 3)
+        self.assertEqual(samples['citsupport_seeds_passed_total'], 1)
+        self.assertEqual(samples['citsupport_seeds_failed_total'], 2)
+        self.assertEqual(samples['citsupport_seeds_timed_out_total'], 1)
+        self.assertEqual(samples['citsupport_seeds_skipped_total'], 0)
+        self.assertIn('# TYPE citsupport_seeds_total counter', body.splitlines())
+
+    def testStepHistogram(self):
+        samples = parse(self.get('/metrics')[2])
+        name = 'citsupport_command_duration_seconds'
+        bucket = name + '_bucket{step="1:scalac",le="%s"}'
+        self.assertEqual(samples[bucket % '0.1'], 0)
+        self.assertEqual(samples[bucket % '0.25'], 1)
+        self.assertEqual(samples[bucket % '1.0'], 2)
+        self.assertEqual(samples[bucket % '600.0'], 2)
+        self.assertEqual(samples[bucket % '+Inf'], 3)
+        self.assertEqual(samples[name + '_count{step="1:scalac"}'], 3)
+        self.assertAlmostEqual(samples[name + '_sum{step="1:scalac"}'], 700.9)
+        self.assertEqual(samples[name + '_count{step="0:firrtl-torture"}'], 1)
+        self.assertEqual(samples[name + '_bucket{step="0:firrtl-torture",le="0.1"}'], 1)
+
+    def testRepoPollGauges(self):
+        samples = parse(self.get('/metrics')[2])
+        label = '{repo="%s"}'
+        self.assertEqual(samples['citsupport_repo_poll_failed' + label % self.good], 0)
+        self.assertEqual(samples['citsupport_repo_poll_failed' + label % self.broken], 1)
+        self.assertEqual(samples['citsupport_repo_changed' + label % self.good], 0)
+        for path in [self.good, self.broken]:
+            self.assertAlmostEqual(samples['citsupport_repo_last_poll_timestamp_seconds' + label % path],
+                                   self.repos.repoMap[path].lastPoll, places=3)
+
+    def testOtherPaths(self):
+        for path in ['/', '/metric', '/metrics/more']:
+            self.assertEqual(self.get(path)[0], 404)
+        self.assertEqual(self.get('/metrics?x=1')[0], 200)
+
+if __name__ == "__main__":
+    unittest.main()
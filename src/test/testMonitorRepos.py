@@ -0,0 +1,254 @@
+'''
+Created on Oct 18, 2026
+'''
+import BaseHTTPServer
+from datetime import timedelta
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+
+from git import Git
+from github3 import login
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+import monitorRepos
+from monitorRepos import BaseRepo, GitRepo, MonitorRepos
+from gitFixture import gitFixture
+
+class testGitRepo(unittest.TestCase):
+    ''' Monitor clones of a local bare repository with the git (ls-remote) backend. '''
+
+    def setUp(self):
+        monitorRepos.remoteHeads.clear()
+        monitorRepos.trackedBranches.clear()
+        self.fixture = gitFixture()
+        self.calls = []
+
+    def tearDown(self):
+        self.fixture.close()
+
+    def countLsRemote(self):
+        ''' Record each ls-remote git runs for us (until the test ends). '''
+        def counted(git, *args):
+            self.calls.append(args)
+            return git._call_process('ls_remote', *args)
+        Git.ls_remote = counted
+        self.addCleanup(delattr, Git, 'ls_remote')
+
+    def push(self, branch):
+        ''' Push a new commit to branch (from a clone of our own). Return its sha. '''
+        pusher = self.fixture.clone('pusher.' + branch, branch)
+        sha = self.fixture.commit(pusher, 'change ' + branch)
+        pusher.git.push('origin', branch)
+        return sha
+
+    def testPushIsNoticed(self):
+        clone = self.fixture.clone('clone')
+        repo = GitRepo(clone.working_dir)
+        self.assertEqual(repo.trackingbranch, 'master')
+        repo.connect()
+        repo.getLastPushed()
+        self.assertEqual(repo.pushedhead, clone.head.commit.hexsha)
+        self.assertEqual(repo.isChanged(), 0)
+        asked = time.time()
+        sha = self.push('master')
+        # What the remote told us since asked is still good enough.
+        repo.getLastPushed(asked - 1)
+        self.assertEqual(repo.isChanged(), 0)
+        # Otherwise we ask again.
+        repo.getLastPushed()
+        self.assertEqual(repo.pushedhead, sha)
+        self.assertEqual(repo.isChanged(), 1)
+
+    def testMonitorReposNoticesPush(self):
+        clone = self.fixture.clone('clone')
+        name = clone.working_dir + '#git'
+        repos = MonitorRepos([name], backend='git')
+        self.assertEqual(repos.reposChangedSince(timedelta(0)), [])
+        self.push('master')
+        self.assertEqual(repos.reposChangedSince(timedelta(0)), [name])
+
+    def testPollerNoticesPushWithinPeriod(self):
+        clone = self.fixture.clone('clone')
+        name = clone.working_dir + '#git'
+        repos = MonitorRepos([name], period=timedelta(seconds=1), backend='git')
+        noticed = threading.Event()
+        repos.start(noticed.set)
+        self.addCleanup(repos.stop)
+        pushed = time.time()
+        self.push('master')
+        self.assertTrue(noticed.wait(10))
+        self.assertLess(time.time() - pushed, 5)
+        self.assertEqual(repos.reposChangedSince(), [name])
+
+    def testPollerKeepsItsDistance(self):
+        clone = self.fixture.clone('clone')
+        self.countLsRemote()
+        repos = MonitorRepos([clone.working_dir + '#git'], period=timedelta(0), backend='git')
+        repos.start()
+        time.sleep(2.5 * monitorRepos.minPollSeconds)
+        repos.stop()
+        # Connecting, and a poll each minPollSeconds.
+        self.assertLessEqual(len(self.calls), 3)
+        self.assertEqual(monitorRepos.rateLimit().interval(1, 0), monitorRepos.minPollSeconds)
+
+    def testOneLsRemoteForSeveralBranches(self):
+        names = [self.fixture.clone(branch, branch).working_dir + '#git' for branch in ['master', 'dev']]
+        self.countLsRemote()
+        repos = MonitorRepos(names, backend='git')
+        (master, dev) = [repos.repoMap[name] for name in names]
+        self.assertEqual(master.remoteurl, dev.remoteurl)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(self.calls[0][1:]), ['refs/heads/dev', 'refs/heads/master'])
+        self.assertEqual(master.isChanged(), 0)
+        self.assertEqual(dev.isChanged(), 0)
+        # Each refresh asks again, once for both.
+        sha = self.push('dev')
+        repos.refresh()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(master.isChanged(), 0)
+        self.assertEqual(dev.pushedhead, sha)
+        self.assertEqual(dev.isChanged(), 1)
+
+class standInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    ''' Answer GETs (conditionally, with ETags) from our server's map of path to JSON body. '''
+
+    def do_GET(self):
+        server = self.server
+        body = server.bodies.get(self.path)
+        if body is None:
+            status = 404
+        else:
+            etag = '"%s"' % (hashlib.sha1(body).hexdigest())
+            status = 304 if self.headers.get('If-None-Match') == etag else 200
+        server.requests.append((self.path, status))
+        self.send_response(status)
+        if status == 200:
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        else:
+            self.send_header('Content-Length', '0')
+        self.end_headers()
+        if status == 200:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class gitHubStandIn():
+    ''' A local HTTP server standing in for the parts of the GitHub API a BaseRepo polls. '''
+
+    def __init__(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), standInHandler)
+        self.server.bodies = {}
+        self.server.requests = []
+        self.url = 'http://127.0.0.1:%d' % (self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, name='gitHubStandIn')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self, path, value):
+        self.server.bodies[path] = value if isinstance(value, str) else json.dumps(value)
+
+    def requests(self):
+        ''' Return (and forget) the (path, status) of each request since we last asked. '''
+        requests = list(self.server.requests)
+        del self.server.requests[:len(requests)]
+        return requests
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+def waitFor(condition, seconds = 10):
+    ''' Poll condition until it's true, or we run out of patience. '''
+    deadline = time.time() + seconds
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+def pushEvent(ref, head, when = '2026-10-18T09:30:00Z'):
+    return { 'type' : 'PushEvent', 'created_at' : when, 'payload' : { 'ref' : ref, 'head' : head } }
+
+class testBaseRepo(unittest.TestCase):
+    ''' Poll a stand-in for the GitHub API, for a clone whose origin is on github.com. '''
+
+    eventsPath = '/repos/owner/widget/events'
+    branchPath = '/repos/owner/widget/branches/master'
+
+    def setUp(self):
+        monitorRepos.responseCache.clear()
+        self.fixture = gitFixture()
+        self.addCleanup(self.fixture.close)
+        self.clone = self.fixture.clone('clone')
+        self.clone.git.remote('set-url', 'origin', 'https://github.com/owner/widget.git')
+        self.standIn = gitHubStandIn()
+        self.addCleanup(self.standIn.close)
+        self.repo = BaseRepo(self.clone.working_dir, self.standIn.url)
+        # Logging in makes no request, so any token will do.
+        self.repo.connect(login(token='not a real token'))
+        self.assertEqual(self.standIn.requests(), [])
+
+    def testPushEvent(self):
+        self.standIn.serve(self.eventsPath, [{ 'type' : 'WatchEvent', 'created_at' : '2026-10-18T10:00:00Z', 'payload' : {} },
+                                             pushEvent('refs/heads/dev', 'a' * 40),
+                                             pushEvent('refs/heads/master', 'b' * 40),
+                                             pushEvent('refs/heads/master', 'c' * 40, '2026-10-17T09:30:00Z')])
+        self.repo.getLastPushed()
+        self.assertEqual(self.repo.pushedhead, 'b' * 40)
+        self.assertEqual(self.repo.pusheddatetime.day, 18)
+        self.assertEqual(self.repo.isChanged(), 1)
+        self.assertEqual(self.standIn.requests(), [(self.eventsPath, 200)])
+
+    def testUnchangedCostsA304(self):
+        self.standIn.serve(self.eventsPath, [pushEvent('refs/heads/master', 'b' * 40)])
+        self.repo.getLastPushed()
+        self.repo.getLastPushed()
+        self.assertEqual(self.standIn.requests(), [(self.eventsPath, 200), (self.eventsPath, 304)])
+        self.assertEqual(self.repo.pushedhead, 'b' * 40)
+        # A new push changes the events (and their ETag).
+        self.standIn.serve(self.eventsPath, [pushEvent('refs/heads/master', 'd' * 40), pushEvent('refs/heads/master', 'b' * 40)])
+        self.repo.getLastPushed()
+        self.assertEqual(self.standIn.requests(), [(self.eventsPath, 200)])
+        self.assertEqual(self.repo.pushedhead, 'd' * 40)
+
+    def testBranchFallback(self):
+        head = self.clone.head.commit.hexsha
+        self.standIn.serve(self.eventsPath, [pushEvent('refs/heads/dev', 'a' * 40)])
+        self.standIn.serve(self.branchPath, { 'name' : 'master',
+                                              'commit' : { 'sha' : head, 'commit' : { 'committer' : { 'date' : '2026-10-16T08:00:00Z' } } } })
+        self.repo.getLastPushed()
+        self.assertEqual(self.standIn.requests(), [(self.eventsPath, 200), (self.branchPath, 200)])
+        self.assertEqual(self.repo.pushedhead, head)
+        self.assertEqual(self.repo.isChanged(), 0)
+        # While the events are unchanged, so is the branch.
+        self.repo.getLastPushed()
+        self.assertEqual(self.standIn.requests(), [(self.eventsPath, 304)])
+        self.assertEqual(self.repo.pushedhead, head)
+
+    def testBadResponsesDontStopThePoller(self):
+        repos = MonitorRepos([], period=timedelta(0))
+        repos.repoMap['widget'] = self.repo
+        repos.start()
+        self.addCleanup(repos.stop)
+        self.standIn.serve(self.eventsPath, 'this isn\'t JSON')
+        self.assertTrue(waitFor(lambda: self.repo.pollError is not None and 'JSON' in self.repo.pollError))
+        self.standIn.serve(self.eventsPath, [{ 'type' : 'PushEvent', 'created_at' : '2026-10-18T09:30:00Z', 'payload' : {} }])
+        self.assertTrue(waitFor(lambda: 'KeyError' in self.repo.pollError))
+        self.standIn.serve(self.eventsPath, [pushEvent('refs/heads/master', 'b' * 40)])
+        self.assertTrue(waitFor(lambda: self.repo.pushedhead == 'b' * 40))
+        self.assertIsNone(self.repo.pollError)
+        self.assertEqual(repos.reposChangedSince(), ['widget'])
+        self.assertTrue(repos.poller.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
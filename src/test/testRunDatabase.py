@@ -0,0 +1,71 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+from runDatabase import runDatabase, queries
+
+class testRunDatabase(unittest.TestCase):
+    ''' The pass/fail history of seeds, and the seeds skipped (their design already tested) which aren't part of it. '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='citSupport.')
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'runs.db')
+
+    def record(self, results):
+        ''' Record a run of (seed, result, skipped)s. '''
+        database = runDatabase(self.path)
+        for (seed, result, skipped) in results:
+            database.seedDone(seed, result, False, [], 'bucket' if result != 0 else None, skipped)
+        database.close()
+        return database
+
+    def query(self, name, **arguments):
+        (description, sql, parameters) = queries[name]
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(sql, [arguments[p] for p in parameters]).fetchall()
+        finally:
+            connection.close()
+
+    def testSkippedIsRecorded(self):
+        self.record([('1', 0, False), ('2', 0, True)])
+        connection = sqlite3.connect(self.path)
+        self.assertEqual(connection.execute('SELECT seed, result, skipped FROM seeds ORDER BY id').fetchall(),
+                         [('1', 0, 0), ('2', 0, 1)])
+        connection.close()
+
+    def testSkippedDoesntFixAFailure(self):
+        self.record([('1', 1, False), ('2', 1, False)])
+        database = self.record([('1', 0, True), ('2', 0, False)])
+        self.assertEqual([seed for (seed, bucket, time) in database.failures()], ['1'])
+
+    def testSkippedIsntFlaky(self):
+        self.record([('1', 1, False), ('2', 1, False), ('1', 0, True), ('2', 0, False)])
+        self.assertEqual([row[0] for row in self.query('flaky', limit=50)], ['2'])
+
+    def testSkippedIsntHistory(self):
+        self.record([('1', 1, False)])
+        self.record([('1', 0, True)])
+        self.assertEqual([row[2] for row in self.query('seed', seed='1', limit=50)], [1])
+
+    def testOlderDatabase(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('''CREATE TABLE seeds (id INTEGER PRIMARY KEY, run INTEGER, seed TEXT, time REAL,
+                                                  result INTEGER, timedout INTEGER, wall REAL, bucket TEXT)''')
+        connection.execute('INSERT INTO seeds (run, seed, time, result, timedout, wall, bucket) VALUES (0, \'1\', 0, 1, 0, 0, \'bucket\')')
+        connection.commit()
+        connection.close()
+        database = self.record([('1', 0, True)])
+        self.assertEqual([seed for (seed, bucket, time) in database.failures()], ['1'])
+
+if __name__ == "__main__":
+    unittest.main()
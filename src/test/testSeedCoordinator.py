@@ -0,0 +1,112 @@
+'''
+Created on Oct 18, 2026
+'''
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+import seedCoordinator
+from seedCoordinator import seedCoordinator as coordinator, coordinatorClient
+
+def waitFor(condition, seconds = 10):
+    ''' Poll condition until it's true, or we run out of patience. '''
+    deadline = time.time() + seconds
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+class testSeedCoordinator(unittest.TestCase):
+    ''' Run a coordinator on localhost, with workers in this process. '''
+
+    def setUp(self):
+        seedCoordinator.retrySeconds = 0.1
+        self.seeds = iter(['s1', 's2', 's3', 's4'])
+        self.results = {}
+        self.resultsLock = threading.Lock()
+        self.coordinator = None
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        if self.coordinator is not None:
+            self.coordinator.shutdown()
+
+    def nextSeed(self):
+        return next(self.seeds, None)
+
+    def onResult(self, report):
+        with self.resultsLock:
+            self.results[report['seed']] = (report['worker'], report['result'])
+
+    def startCoordinator(self, leaseSeconds = seedCoordinator.defaultLeaseSeconds):
+        self.coordinator = coordinator(self.nextSeed, self.onResult, 0, '127.0.0.1', leaseSeconds)
+        self.coordinator.start()
+
+    def connect(self, worker, count):
+        client = coordinatorClient('127.0.0.1', self.coordinator.port, worker, count)
+        self.clients.append(client)
+        return client
+
+    def testLeaseAndResult(self):
+        self.startCoordinator()
+        client = self.connect('w1', 2)
+        seeds = []
+        while True:
+            seed = client.next()
+            if seed is None:
+                break
+            seeds.append(seed)
+            client.result(seed, 0 if seed != 's3' else 1)
+        self.assertEqual(seeds, ['s1', 's2', 's3', 's4'])
+        self.assertEqual(self.results, { 's1' : ('w1', 0), 's2' : ('w1', 0), 's3' : ('w1', 1), 's4' : ('w1', 0) })
+        self.assertTrue(self.coordinator.finished())
+        self.assertEqual(self.coordinator.reassigned, 0)
+
+    def testDeadWorkerSeedsReassigned(self):
+        self.startCoordinator()
+        dying = self.connect('dying', 3)
+        self.assertEqual(dying.next(), 's1')
+        dying.result('s1', 0)
+        # It dies holding s2 and s3.
+        dying.close()
+        self.assertTrue(waitFor(lambda: self.coordinator.reassigned == 2))
+        survivor = self.connect('survivor', 1)
+        seeds = []
+        while True:
+            seed = survivor.next()
+            if seed is None:
+                break
+            seeds.append(seed)
+            survivor.result(seed, 0)
+        self.assertEqual(seeds, ['s2', 's3', 's4'])
+        self.assertEqual(sorted(self.results.keys()), ['s1', 's2', 's3', 's4'])
+        self.assertEqual(self.results['s1'][0], 'dying')
+        self.assertEqual(self.results['s2'][0], 'survivor')
+        self.assertTrue(self.coordinator.finished())
+
+    def testExpiredLeaseReassigned(self):
+        self.startCoordinator(leaseSeconds = 0.2)
+        # A worker which hangs (it never renews its lease), but stays connected.
+        hung = socket.create_connection(('127.0.0.1', self.coordinator.port))
+        try:
+            hung.sendall(json.dumps({ 'op' : 'lease', 'worker' : 'hung', 'count' : 2 }) + '\n')
+            reply = json.loads(hung.makefile('r').readline())
+            self.assertEqual(reply['seeds'], ['s1', 's2'])
+            time.sleep(0.3)
+            survivor = self.connect('survivor', 2)
+            self.assertEqual(survivor.next(), 's1')
+            self.assertEqual(self.coordinator.reassigned, 2)
+        finally:
+            hung.close()
+
+if __name__ == "__main__":
+    unittest.main()
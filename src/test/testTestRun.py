@@ -0,0 +1,73 @@
+'''
+Created on Oct 18, 2026
+'''
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+from testRun import testRun
+
+def liveTimers():
+    ''' Return the watchdogs still running, after giving any cancelled ones a moment to finish. '''
+    timers = [t for t in threading.enumerate() if isinstance(t, threading._Timer) and t.function.__name__ == 'expire']
+    for t in timers:
+        t.join(1.0)
+    return [t for t in timers if t.is_alive()]
+
+class lateWatchdog(testRun):
+    ''' A testRun whose watchdog fires just after each command has exited (and been reaped). '''
+
+    def wait(self, process):
+        result = testRun.wait(self, process)
+        self.expire()
+        return result
+
+class abortingServer():
+    ''' A stand-in jvmServer, which lets the run be aborted (after its watchdog is set) as it declines each command. '''
+
+    def __init__(self):
+        self.test = None
+
+    def run(self, command):
+        self.test.abort()
+        return None
+
+    def abort(self):
+        pass
+
+class testWatchdog(unittest.TestCase):
+    ''' The per-command timeouts of testRun. '''
+
+    def testTimeout(self):
+        test = testRun(commandTimeout=0.5)
+        started = time.time()
+        result = test.run(['sleep 30'], {})
+        self.assertLess(time.time() - started, 10)
+        self.assertNotEqual(result, 0)
+        self.assertTrue(test.timedOut)
+        self.assertTrue(test.records[0]['timedout'])
+        self.assertEqual(liveTimers(), [])
+
+    def testWatchdogAfterExitIsIgnored(self):
+        test = lateWatchdog(commandTimeout=30)
+        self.assertEqual(test.run(['true', 'true'], {}), 0)
+        self.assertFalse(test.timedOut)
+        self.assertEqual(len(test.records), 2)
+        self.assertNotIn('timedout', test.records[0])
+        self.assertEqual(liveTimers(), [])
+
+    def testWatchdogCancelledWhenAborted(self):
+        server = abortingServer()
+        test = testRun(server=server, commandTimeout=30)
+        server.test = test
+        test.run(['sleep 30'], {})
+        self.assertTrue(test.aborted)
+        self.assertEqual(test.records, [])
+        self.assertEqual(liveTimers(), [])
+
+if __name__ == "__main__":
+    unittest.main()
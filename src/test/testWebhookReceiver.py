@@ -0,0 +1,81 @@
+'''
+Created on Oct 18, 2026
+'''
+import hashlib
+import hmac
+import httplib
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'citSupport'))
+
+import monitorRepos
+from monitorRepos import MonitorRepos
+from gitFixture import gitFixture
+
+fixtureDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+secret = 'not very secret'
+
+class testWebhookReceiver(unittest.TestCase):
+    ''' Deliver a recorded push event to the webhookReceiver of a MonitorRepos watching a clone of a local remote. '''
+
+    def setUp(self):
+        monitorRepos.remoteHeads.clear()
+        monitorRepos.trackedBranches.clear()
+        self.fixture = gitFixture('owner', 'widget.git')
+        clone = self.fixture.clone('clone')
+        self.name = clone.working_dir + '#git'
+        self.repos = MonitorRepos([self.name], backend='git')
+        # Listen (on any free port) as citSupport --webhook does.
+        self.repos.listen(0, secret)
+        self.receiver = self.repos.receiver
+        with open(os.path.join(fixtureDir, 'push.json'), 'r') as f:
+            self.body = f.read()
+
+    def tearDown(self):
+        self.repos.stop()
+        self.fixture.close()
+
+    def deliver(self, body, signature, event = 'push'):
+        ''' POST a webhook delivery, and return the response's status. '''
+        connection = httplib.HTTPConnection('127.0.0.1', self.receiver.port, timeout=10)
+        try:
+            connection.request('POST', '/', body, { 'Content-Type' : 'application/json',
+                                                    'X-GitHub-Event' : event,
+                                                    'X-Hub-Signature-256' : signature })
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def sign(self, body, key = secret):
+        return 'sha256=' + hmac.new(key, body, hashlib.sha256).hexdigest()
+
+    def testValidSignature(self):
+        repo = self.repos.repoMap[self.name]
+        self.assertEqual(repo.isChanged(), 0)
+        self.assertEqual(self.deliver(self.body, self.sign(self.body)), 200)
+        self.assertEqual(repo.pushedhead, json.loads(self.body)['after'])
+        self.assertEqual(repo.isChanged(), 1)
+        self.assertTrue(self.repos.changed.is_set())
+        self.assertEqual(self.repos.reposChangedSince(), [self.name])
+
+    def testBadSignature(self):
+        repo = self.repos.repoMap[self.name]
+        self.assertEqual(self.deliver(self.body, self.sign(self.body, 'the wrong secret')), 403)
+        tampered = self.body.replace('refs/heads/master', 'refs/heads/dev')
+        self.assertEqual(self.deliver(tampered, self.sign(self.body)), 403)
+        self.assertEqual(repo.isChanged(), 0)
+        self.assertFalse(self.repos.changed.is_set())
+
+    def testOtherBranch(self):
+        body = self.body.replace('refs/heads/master', 'refs/heads/dev')
+        self.assertEqual(self.deliver(body, self.sign(body)), 200)
+        self.assertEqual(self.repos.repoMap[self.name].isChanged(), 0)
+        self.assertFalse(self.repos.changed.is_set())
+
+if __name__ == "__main__":
+    unittest.main()